@@ -26,18 +26,30 @@ final class CoreBridge {
     }
 
     func runLookup(path: String) throws -> LookupPayload {
-        let data = try runRaw(args: ["lookup", "--path", path])
-        let envelope = try decoder.decode(CoreEnvelope<LookupPayload>.self, from: data)
-        if let error = envelope.error { throw error }
-        guard let payload = envelope.data else {
-            throw CoreError(code: "BAD_RESPONSE", message: "Missing payload")
-        }
-        return payload
+        let payload = try runColumnar(args: ["lookup", "--path", path])
+        return LookupPayload(
+            fileHash: payload.fileHash,
+            records: try payload.captureRecords(),
+            count: payload.count
+        )
     }
 
     func runSearch(query: String, limit: Int = 20) throws -> SearchPayload {
-        let data = try runRaw(args: ["search", "--q", query, "--limit", "\(limit)"])
-        let envelope = try decoder.decode(CoreEnvelope<SearchPayload>.self, from: data)
+        let payload = try runColumnar(args: ["search", "--q", query, "--limit", "\(limit)"])
+        return SearchPayload(
+            query: payload.query ?? query,
+            backend: payload.backend ?? "",
+            results: try payload.captureRecords(),
+            count: payload.count
+        )
+    }
+
+    // Record lists use the compact columnar encoding, projected to the fields
+    // CaptureRecord decodes, instead of one keyed JSON object per record.
+    private func runColumnar(args: [String]) throws -> ColumnarPayload {
+        let fields = CaptureRecord.columnarFields.joined(separator: ",")
+        let data = try runRaw(args: args + ["--output", "columnar", "--fields", fields])
+        let envelope = try decoder.decode(CoreEnvelope<ColumnarPayload>.self, from: data)
         if let error = envelope.error { throw error }
         guard let payload = envelope.data else {
             throw CoreError(code: "BAD_RESPONSE", message: "Missing payload")
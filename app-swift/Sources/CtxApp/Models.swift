@@ -24,7 +24,7 @@ struct CapturePayload: Decodable {
 }
 
 struct LookupPayload: Decodable {
-    let fileHash: String
+    let fileHash: String?
     let records: [CaptureRecord]
     let count: Int
 
@@ -51,7 +51,7 @@ struct CaptureRecord: Decodable {
     let originURL: String
     let note: String?
 
-    enum CodingKeys: String, CodingKey {
+    enum CodingKeys: String, CodingKey, CaseIterable {
         case id
         case createdAt = "created_at"
         case fileName = "file_name"
@@ -61,3 +61,94 @@ struct CaptureRecord: Decodable {
         case note
     }
 }
+
+// `--output columnar` payload: field names once, then one array per record.
+struct ColumnarPayload: Decodable {
+    let query: String?
+    let backend: String?
+    let fileHash: String?
+    let count: Int
+    let fields: [String]
+    let rows: [[ColumnValue]]
+
+    enum CodingKeys: String, CodingKey {
+        case query
+        case backend
+        case fileHash = "file_hash"
+        case count
+        case fields
+        case rows
+    }
+
+    func captureRecords() throws -> [CaptureRecord] {
+        let index = Dictionary(
+            fields.enumerated().map { ($1, $0) },
+            uniquingKeysWith: { first, _ in first }
+        )
+        return try rows.map { try CaptureRecord(row: $0, index: index) }
+    }
+}
+
+enum ColumnValue: Decodable {
+    case string(String)
+    case int(Int)
+    case double(Double)
+    case bool(Bool)
+    case null
+
+    init(from decoder: Decoder) throws {
+        let container = try decoder.singleValueContainer()
+        if container.decodeNil() {
+            self = .null
+        } else if let value = try? container.decode(String.self) {
+            self = .string(value)
+        } else if let value = try? container.decode(Int.self) {
+            self = .int(value)
+        } else if let value = try? container.decode(Double.self) {
+            self = .double(value)
+        } else {
+            self = .bool(try container.decode(Bool.self))
+        }
+    }
+
+    var stringValue: String? {
+        if case let .string(value) = self { return value }
+        return nil
+    }
+
+    var intValue: Int? {
+        if case let .int(value) = self { return value }
+        return nil
+    }
+}
+
+extension CaptureRecord {
+    // Passed as --fields so ctx-core only serializes the columns the app reads.
+    static let columnarFields = CodingKeys.allCases.map(\.rawValue)
+
+    init(row: [ColumnValue], index: [String: Int]) throws {
+        func value(_ key: CodingKeys) -> ColumnValue {
+            guard let position = index[key.rawValue], position < row.count else { return .null }
+            return row[position]
+        }
+        guard
+            let id = value(.id).stringValue,
+            let createdAt = value(.createdAt).intValue,
+            let fileName = value(.fileName).stringValue,
+            let filePathAtCapture = value(.filePathAtCapture).stringValue,
+            let originTitle = value(.originTitle).stringValue,
+            let originURL = value(.originURL).stringValue
+        else {
+            throw CoreError(code: "BAD_RESPONSE", message: "Malformed columnar row")
+        }
+        self.init(
+            id: id,
+            createdAt: createdAt,
+            fileName: fileName,
+            filePathAtCapture: filePathAtCapture,
+            originTitle: originTitle,
+            originURL: originURL,
+            note: value(.note).stringValue
+        )
+    }
+}
@@ -0,0 +1,207 @@
+from __future__ import annotations
+
+import argparse
+import functools
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+from typing import Any
+
+from ctx_core.db import Database
+from ctx_core.errors import CtxError
+from ctx_core.main import (
+    as_stream,
+    build_parser,
+    dispatch,
+    failure_for,
+    prepare_database,
+    stream_messages,
+)
+from ctx_core.metrics import CommandMetrics, record_command
+
+
+# Values for required options; only used to read the parser's defaults.
+REQUIRED_PLACEHOLDERS: dict[str, list[str]] = {
+    "lookup": ["--path", ""],
+    "search": ["--q", ""],
+}
+
+
+@functools.cache
+def command_defaults(command: str) -> dict[str, Any]:
+    return vars(build_parser().parse_args([command, *REQUIRED_PLACEHOLDERS.get(command, [])]))
+
+
+def command_args(command: str, **values: Any) -> argparse.Namespace:
+    # Typed values are set on the namespace directly rather than rendered back
+    # into argv, so a query or path such as "-draft" is never read as an option.
+    defaults = command_defaults(command)
+    unknown = set(values) - set(defaults)
+    if unknown:
+        raise TypeError(f"unknown {command} arguments: {', '.join(sorted(unknown))}")
+    return argparse.Namespace(**{**defaults, **values})
+
+
+def search_args(
+    query: str,
+    *,
+    limit: int = 20,
+    scan_roots: Iterable[str] = (),
+    reconcile_paths: bool = True,
+    include_archive: bool = False,
+) -> argparse.Namespace:
+    return command_args(
+        "search",
+        q=query,
+        limit=limit,
+        scan_root=list(scan_roots) or None,
+        reconcile_paths=reconcile_paths,
+        include_archive=include_archive,
+    )
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    try:
+        return build_parser().parse_args(argv)
+    except SystemExit as exc:
+        raise CtxError(
+            code="INVALID_ARGUMENTS",
+            message="Invalid ctx-core arguments.",
+            details={"argv": argv},
+        ) from exc
+
+
+class CtxCore:
+    """Runs ctx-core commands in-process against one shared Database.
+
+    Calls return the same (exit_code, envelope) pair that `ctx-core` prints.
+    """
+
+    def __init__(self, db_path: Path | None = None) -> None:
+        self.db = Database(db_path)
+        try:
+            prepare_database(self.db)
+        except Exception:
+            self.db.close()
+            raise
+
+    def close(self) -> None:
+        self.db.close()
+
+    def __enter__(self) -> CtxCore:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    def execute(self, argv: list[str]) -> tuple[int, dict[str, Any]]:
+        try:
+            args = parse_args(argv)
+        except CtxError as exc:
+            return failure_for(exc)
+        return self.execute_args(args)
+
+    def execute_args(self, args: argparse.Namespace) -> tuple[int, dict[str, Any]]:
+        args = argparse.Namespace(**{**vars(args), "output": "json"})
+        metrics = CommandMetrics(args.command)
+        try:
+            payload = dispatch(args, self.db)
+            metrics.observe(payload["data"])
+            return 0, payload
+        except Exception as exc:
+            rc, failure = failure_for(exc)
+            metrics.fail(failure)
+            return rc, failure
+        finally:
+            record_command(self.db, metrics)
+
+    def stream(self, argv: list[str]) -> Iterator[dict[str, Any]]:
+        try:
+            args = parse_args(argv)
+        except CtxError as exc:
+            yield {"type": "trailer", **failure_for(exc)[1]}
+            return
+        yield from self.stream_args(args)
+
+    def stream_args(self, args: argparse.Namespace) -> Iterator[dict[str, Any]]:
+        # Yields the same header/record/trailer messages as `--output ndjson`.
+        args = argparse.Namespace(**{**vars(args), "output": "ndjson"})
+        metrics = CommandMetrics(args.command)
+        try:
+            for message in stream_messages(as_stream(args, dispatch(args, self.db))):
+                if message["type"] != "record":
+                    metrics.observe(message["data"])
+                yield message
+        except Exception as exc:
+            _, failure = failure_for(exc)
+            metrics.fail(failure)
+            yield {"type": "trailer", **failure}
+        finally:
+            record_command(self.db, metrics)
+
+    def capture(
+        self,
+        *,
+        origin_title: str,
+        origin_url: str,
+        downloads_dir: str = "~/Downloads",
+        within: int = 60,
+        note: str | None = None,
+        source_app: str | None = None,
+    ) -> tuple[int, dict[str, Any]]:
+        return self.execute_args(
+            command_args(
+                "capture",
+                downloads_dir=downloads_dir,
+                within=within,
+                origin_title=origin_title,
+                origin_url=origin_url,
+                note=note,
+                source_app=source_app,
+            )
+        )
+
+    def lookup(
+        self, path: str, *, limit: int = 20, verify: bool = False
+    ) -> tuple[int, dict[str, Any]]:
+        return self.execute_args(command_args("lookup", path=path, limit=limit, verify=verify))
+
+    def search(
+        self,
+        query: str,
+        *,
+        limit: int = 20,
+        scan_roots: Iterable[str] = (),
+        reconcile_paths: bool = True,
+        include_archive: bool = False,
+    ) -> tuple[int, dict[str, Any]]:
+        return self.execute_args(
+            search_args(
+                query,
+                limit=limit,
+                scan_roots=scan_roots,
+                reconcile_paths=reconcile_paths,
+                include_archive=include_archive,
+            )
+        )
+
+    def stream_search(
+        self,
+        query: str,
+        *,
+        limit: int = 20,
+        scan_roots: Iterable[str] = (),
+        reconcile_paths: bool = True,
+        include_archive: bool = False,
+    ) -> Iterator[dict[str, Any]]:
+        return self.stream_args(
+            search_args(
+                query,
+                limit=limit,
+                scan_roots=scan_roots,
+                reconcile_paths=reconcile_paths,
+                include_archive=include_archive,
+            )
+        )
+
+    def get_capture(self, capture_id: str) -> dict[str, Any] | None:
+        return self.db.get_capture_by_id(capture_id)
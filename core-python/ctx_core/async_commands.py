@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+from collections.abc import AsyncIterator
+from pathlib import Path
+from typing import Any
+
+from ctx_core.engine import AsyncEngine
+from ctx_core.encoding import project_records, project_update
+from ctx_core.main import (
+    RecordStream,
+    capture_response,
+    check_fields,
+    emit_failure,
+    emit_line,
+    emit_payload,
+    failure_for,
+    group_stale_by_hash,
+    is_stale,
+    ok,
+    persist_relocations,
+    record_capture,
+    relocation_update,
+    require_safari_context,
+    start_reconcile,
+    stream_header,
+    stream_trailer,
+    streams_records,
+)
+from ctx_core.metrics import CommandMetrics, record_command
+from ctx_core.retention import iter_archive_search
+
+
+async def capture_async(
+    args: argparse.Namespace, engine: AsyncEngine
+) -> dict[str, Any] | RecordStream:
+    require_safari_context(args.origin_title, args.origin_url)
+    downloads_dir = Path(args.downloads_dir).expanduser().resolve()
+    # Opening and migrating the database overlaps with stability sampling and hashing.
+    opening = asyncio.ensure_future(engine.open())
+    try:
+        hashed = await engine.stable_hashed_download(downloads_dir, args.within)
+    except BaseException:
+        # Report the capture failure, not a database error from the open it overlapped.
+        await asyncio.gather(opening, return_exceptions=True)
+        raise
+    await opening
+    record = await engine.run_db(
+        lambda db: record_capture(
+            args, db, hashed.path, hashed.size, hashed.file_hash, hashed.file_fingerprint
+        )
+    )
+    return capture_response(args, record)
+
+
+async def iter_search_async(
+    args: argparse.Namespace, engine: AsyncEngine
+) -> AsyncIterator[dict[str, Any]]:
+    # Yields the ndjson messages: results go out straight after the query, and
+    # reconciliation then streams {"type": "update"} messages for moved files.
+    await engine.open()
+    records, backend = await engine.run_db(lambda db: db.search_captures(args.q, limit=args.limit))
+    stream = RecordStream(
+        command="search",
+        header={"query": args.q, "backend": backend},
+        records=records,
+        summary={"reconciled": 0, "reconcile_timeouts": 0},
+    )
+    summary = stream.summary
+    yield stream_header(stream)
+    fields = args.fields if args.output == "ndjson" else None
+    if fields and "id" not in fields:
+        # Update messages refer to records by id.
+        fields = ["id", *fields]
+    for record in project_records(records, fields) if fields else records:
+        yield {"type": "record", "data": record}
+    count = len(records)
+
+    if args.include_archive:
+        summary["archive_backend"] = None
+        archived = await engine.run_db(
+            lambda db: list(iter_archive_search(db, args.q, args.limit - count, summary))
+        )
+        for record in project_records(archived, fields) if fields else archived:
+            yield {"type": "record", "data": record}
+        count += len(archived)
+
+    if args.reconcile_paths:
+        scan = await engine.run_db(lambda db: start_reconcile(args, db))
+        to_scan, by_hash = group_stale_by_hash(
+            [record for record in records if is_stale(record)], args.reconcile_max_records
+        )
+        located = engine.locate_files(
+            to_scan,
+            scan_roots=scan.scan_roots,
+            dir_priorities=scan.dir_priorities,
+            max_seconds=args.reconcile_max_seconds,
+            max_candidates=args.reconcile_max_candidates,
+        )
+        async for record, observed_path, stats in located:
+            summary["reconcile_timeouts"] += stats.timeouts
+            if not observed_path or observed_path == record["file_path_at_capture"]:
+                continue
+            scan.relocated[record["file_hash"]] = observed_path
+            for match in by_hash[record["file_hash"]]:
+                summary["reconciled"] += 1
+                update = relocation_update(match, observed_path)
+                yield {"type": "update", "data": project_update(update, fields)}
+        await engine.run_db(lambda db: persist_relocations(db, scan))
+
+    yield stream_trailer(stream, count)
+
+
+async def search_async(
+    args: argparse.Namespace, engine: AsyncEngine
+) -> dict[str, Any] | RecordStream:
+    # Buffered formats apply the streamed updates to the records before output.
+    header: dict[str, Any] = {}
+    records: list[dict[str, Any]] = []
+    summary: dict[str, Any] = {}
+    async for message in iter_search_async(args, engine):
+        if message["type"] == "header":
+            header = message["data"]
+        elif message["type"] == "record":
+            records.append(message["data"])
+        elif message["type"] == "update":
+            for record in records:
+                if record["id"] == message["data"]["id"]:
+                    record.update(message["data"])
+        else:
+            summary = message["data"]
+            summary.pop("count")
+    if streams_records(args):
+        return RecordStream(command="search", header=header, records=records, summary=summary)
+    return ok({**header, "results": records, "count": len(records), **summary})
+
+
+async def run_async(args: argparse.Namespace) -> int:
+    metrics = CommandMetrics(args.command)
+    engine = AsyncEngine()
+    try:
+        check_fields(args)
+        if args.command == "search" and args.output == "ndjson":
+            async for message in iter_search_async(args, engine):
+                emit_line(message)
+                if message["type"] in ("header", "trailer"):
+                    metrics.observe(message["data"])
+        else:
+            if args.command == "capture":
+                payload = await capture_async(args, engine)
+            else:
+                payload = await search_async(args, engine)
+            metrics.observe(emit_payload(args, payload))
+        return 0
+    except Exception as exc:
+        rc, failure = failure_for(exc)
+        metrics.fail(failure)
+        emit_failure(failure, args.output)
+        return rc
+    finally:
+        if engine.db is not None:
+            await engine.run_db(lambda db: record_command(db, metrics))
+        await engine.close()
+
+
+def run_async_command(args: argparse.Namespace) -> int:
+    return asyncio.run(run_async(args))
@@ -1,76 +1,478 @@
 from __future__ import annotations
 
+import functools
+import importlib.util
+import random
 import sqlite3
 import time
 import uuid
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from itertools import chain
 from pathlib import Path
-from typing import Any
+from types import ModuleType
+from typing import Any, TypeVar
 
+from ctx_core.errors import CtxError
 from ctx_core.paths import ensure_parent_dir, resolve_db_path
+from ctx_core.reconcile import decayed_score
+from ctx_core.urls import normalize_host
+
+T = TypeVar("T")
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent.parent / "migrations"
+MIGRATION_SUFFIXES = (".sql", ".py")
+BACKFILL_CHUNK_ROWS = 500
+# Budget for the backfill step every command takes; `ctx-core migrate` runs to completion.
+BACKFILL_STEP_SECONDS = 0.05
+
+MAX_RELOCATION_HIT_DIRS = 500
+
+BUSY_TIMEOUT_MS = 2000
+METRICS_BUSY_TIMEOUT_MS = 100
+BACKFILL_BUSY_TIMEOUT_MS = 100
+BUSY_RETRY_ATTEMPTS = 5
+BUSY_RETRY_BASE_SECONDS = 0.05
+BUSY_RETRY_MAX_SECONDS = 1.0
+
+SQLITE_BUSY = 5
+SQLITE_LOCKED = 6
+
+FTS_SYNCED_KEY = "fts_synced"
+
+FTS_COLUMNS = {
+    "id",
+    "file_name",
+    "file_path_at_capture",
+    "origin_title",
+    "origin_url",
+    "note",
+}
+
+LOOKUP_BY_HASH_SQL = """
+SELECT * FROM captures
+WHERE file_hash = ?
+ORDER BY created_at DESC
+LIMIT ?
+"""
+
+# Rows captured before fingerprints existed have a NULL fingerprint and
+# must still be treated as possible matches for their size.
+SIZE_FINGERPRINT_PROBE_SQL = """
+SELECT 1 FROM captures
+WHERE file_size_bytes = ?
+  AND (file_fingerprint = ? OR file_fingerprint IS NULL)
+LIMIT 1
+"""
+
+REFRESH_LOCATION_SQL = """
+UPDATE captures
+SET file_name = ?,
+    file_path_at_capture = ?,
+    file_fingerprint = coalesce(file_fingerprint, ?)
+WHERE file_hash = ?
+"""
+
+REFRESH_FTS_LOCATION_SQL = """
+UPDATE captures_fts
+SET file_name = ?, file_path_at_capture = ?
+WHERE rowid IN (
+  SELECT rowid FROM captures WHERE file_hash = ?
+)
+"""
+
+SEARCH_RECENT_SQL = "SELECT * FROM captures ORDER BY created_at DESC LIMIT ?"
+
+SEARCH_FTS_SQL = """
+SELECT c.* FROM captures_fts f
+JOIN captures c ON c.id = f.id
+WHERE captures_fts MATCH ?
+ORDER BY c.created_at DESC
+LIMIT ?
+"""
+
+SEARCH_LIKE_SQL = """
+SELECT * FROM captures
+WHERE lower(file_name) LIKE ?
+   OR lower(file_path_at_capture) LIKE ?
+   OR lower(origin_title) LIKE ?
+   OR lower(origin_url) LIKE ?
+   OR lower(coalesce(note, '')) LIKE ?
+ORDER BY created_at DESC
+LIMIT ?
+"""
+
+GET_CAPTURE_SQL = "SELECT * FROM captures WHERE id = ? LIMIT 1"
+
+# Keyset pagination over (created_at, id), oldest first, used by retention.
+CAPTURES_PAGE_SQL = """
+SELECT * FROM captures
+WHERE (created_at, id) > (?, ?)
+ORDER BY created_at, id
+LIMIT ?
+"""
+
+# Hot queries with representative parameters, used by `ctx-core doctor` to
+# check query plans.
+HOT_QUERIES: dict[str, tuple[str, tuple[Any, ...]]] = {
+    "lookup_by_hash": (LOOKUP_BY_HASH_SQL, ("0" * 64, 20)),
+    "size_fingerprint_probe": (SIZE_FINGERPRINT_PROBE_SQL, (0, "0" * 64)),
+    "refresh_location": (REFRESH_LOCATION_SQL, ("", "", None, "0" * 64)),
+    "refresh_fts_location": (REFRESH_FTS_LOCATION_SQL, ("", "", "0" * 64)),
+    "search_recent": (SEARCH_RECENT_SQL, (20,)),
+    "search_fts": (SEARCH_FTS_SQL, ("doctor", 20)),
+    "search_like": (SEARCH_LIKE_SQL, ("%doctor%",) * 5 + (20,)),
+    "get_capture": (GET_CAPTURE_SQL, ("",)),
+}
+
+
+def is_busy_error(exc: BaseException) -> bool:
+    if not isinstance(exc, sqlite3.OperationalError):
+        return False
+    code = getattr(exc, "sqlite_errorcode", None)
+    if code is not None:
+        return code & 0xFF in (SQLITE_BUSY, SQLITE_LOCKED)
+    message = str(exc).lower()
+    return "is locked" in message or "is busy" in message
+
+
+def retry_busy(operation: Callable[[], T]) -> T:
+    # busy_timeout already waits inside SQLite; this adds a bounded number of
+    # jittered retries on top before giving up with a distinct DB_BUSY error.
+    for attempt in range(BUSY_RETRY_ATTEMPTS):
+        try:
+            return operation()
+        except sqlite3.OperationalError as exc:
+            if not is_busy_error(exc):
+                raise
+            if attempt == BUSY_RETRY_ATTEMPTS - 1:
+                raise CtxError(
+                    code="DB_BUSY",
+                    message="Database is busy; another ctx-core process holds the write lock.",
+                    details={"attempts": BUSY_RETRY_ATTEMPTS, "reason": str(exc)},
+                ) from exc
+            ceiling = min(BUSY_RETRY_MAX_SECONDS, BUSY_RETRY_BASE_SECONDS * (2**attempt))
+            time.sleep(random.uniform(0, ceiling))
+    raise AssertionError("unreachable")
+
+
+def migration_version(path: Path) -> int:
+    return int(path.name.split("_", 1)[0])
+
+
+def migration_files() -> list[Path]:
+    return sorted(
+        (
+            path
+            for path in MIGRATIONS_DIR.iterdir()
+            if path.suffix in MIGRATION_SUFFIXES and path.name[:1].isdigit()
+        ),
+        key=migration_version,
+    )
+
+
+@functools.cache
+def load_python_migration(path: Path) -> ModuleType:
+    # Python migrations may define SCHEMA (SQL applied with the other migrations),
+    # backfill(conn, cursor, limit) -> (next_cursor | None, rows) run in chunks
+    # afterwards, and remaining(conn, cursor) -> rows left, for status reports.
+    spec = importlib.util.spec_from_file_location(f"ctx_migration_{path.stem}", path)
+    assert spec is not None and spec.loader is not None
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def split_sql_statements(script: str) -> list[str]:
+    statements: list[str] = []
+    buffer = ""
+    for line in script.splitlines(keepends=True):
+        buffer += line
+        if sqlite3.complete_statement(buffer):
+            statements.append(buffer.strip())
+            buffer = ""
+    if buffer.strip():
+        statements.append(buffer.strip())
+    return statements
 
 
 class Database:
     def __init__(self, db_path: Path | None = None) -> None:
         self.db_path = db_path or resolve_db_path()
         ensure_parent_dir(self.db_path)
-        self.conn = sqlite3.connect(self.db_path)
+        # Autocommit mode: transactions are opened explicitly by write().
+        self.conn = sqlite3.connect(
+            self.db_path,
+            timeout=BUSY_TIMEOUT_MS / 1000,
+            isolation_level=None,
+        )
         self.conn.row_factory = sqlite3.Row
+        self.fts_available: bool | None = None
+        # Set by every committed write(); lets metrics piggyback on commands
+        # that already took the write lock.
+        self.has_written = False
 
     def close(self) -> None:
         self.conn.close()
 
     def configure(self) -> None:
-        self.conn.execute("PRAGMA journal_mode=WAL;")
+        self.conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS};")
+        # Only possible on a new, empty database; existing ones are converted
+        # explicitly by `ctx-core compact --enable-incremental-vacuum`.
+        if self.conn.execute("PRAGMA page_count").fetchone()[0] == 0:
+            self.conn.execute("PRAGMA auto_vacuum=INCREMENTAL;")
+        retry_busy(lambda: self.conn.execute("PRAGMA journal_mode=WAL;"))
         self.conn.execute("PRAGMA foreign_keys=ON;")
 
-    def run_migrations(self) -> None:
-        migrations_dir = Path(__file__).resolve().parent.parent / "migrations"
-        self.conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS schema_migrations (
-              version INTEGER PRIMARY KEY,
-              applied_at INTEGER NOT NULL
-            )
-            """
-        )
-        applied_versions = {
+    @contextmanager
+    def write(self, busy_timeout_ms: int | None = None) -> Iterator[sqlite3.Connection]:
+        # BEGIN IMMEDIATE takes the write lock up front, so concurrent writers
+        # queue on busy_timeout instead of failing on a read-to-write upgrade.
+        # With an explicit busy_timeout_ms the lock is tried once, without retries.
+        if busy_timeout_ms is None:
+            retry_busy(lambda: self.conn.execute("BEGIN IMMEDIATE"))
+        else:
+            self.conn.execute(f"PRAGMA busy_timeout={int(busy_timeout_ms)};")
+            try:
+                self.conn.execute("BEGIN IMMEDIATE")
+            finally:
+                self.conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS};")
+        try:
+            yield self.conn
+            retry_busy(lambda: self.conn.execute("COMMIT"))
+            self.has_written = True
+        except BaseException:
+            if self.conn.in_transaction:
+                self.conn.rollback()
+            raise
+
+    def applied_migration_versions(self) -> set[int]:
+        exists = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_migrations'"
+        ).fetchone()
+        if not exists:
+            return set()
+        return {
             row["version"]
             for row in self.conn.execute("SELECT version FROM schema_migrations").fetchall()
         }
 
-        migration_files = sorted(migrations_dir.glob("*.sql"))
-        for migration_file in migration_files:
-            version = int(migration_file.name.split("_", 1)[0])
-            if version in applied_versions:
-                continue
-            sql = migration_file.read_text(encoding="utf-8")
-            with self.conn:
-                self.conn.executescript(sql)
+    def run_migrations(self) -> None:
+        applied_versions = self.applied_migration_versions()
+        pending = [
+            migration_file
+            for migration_file in migration_files()
+            if migration_version(migration_file) not in applied_versions
+        ]
+        if not pending:
+            return
+
+        with self.write():
+            self.conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                  version INTEGER PRIMARY KEY,
+                  applied_at INTEGER NOT NULL
+                )
+                """
+            )
+            # Another process may have migrated while we waited for the lock.
+            applied_versions = self.applied_migration_versions()
+            for migration_file in pending:
+                version = migration_version(migration_file)
+                if version in applied_versions:
+                    continue
+                if migration_file.suffix == ".py":
+                    self._apply_python_migration(version, load_python_migration(migration_file))
+                    continue
+                sql = migration_file.read_text(encoding="utf-8")
+                for statement in split_sql_statements(sql):
+                    self.conn.execute(statement)
                 self.conn.execute(
                     "INSERT INTO schema_migrations(version, applied_at) VALUES (?, ?)",
                     (version, int(time.time())),
                 )
+            # Migrations may reshape captures or captures_fts; ensure_fts re-checks them.
+            self.mark_fts_stale()
 
-    def ensure_fts(self) -> bool:
-        expected_columns = {
-            "id",
-            "file_name",
-            "file_path_at_capture",
-            "origin_title",
-            "origin_url",
-            "note",
-        }
+    def _apply_python_migration(self, version: int, module: ModuleType) -> None:
+        # Only the schema step runs under the migration lock; existing rows are
+        # backfilled later by run_backfills() in short, resumable chunks.
+        for statement in split_sql_statements(getattr(module, "SCHEMA", "")):
+            self.conn.execute(statement)
+        now = int(time.time())
+        self.conn.execute(
+            """
+            INSERT INTO schema_migrations(version, applied_at, state, updated_at)
+            VALUES (?, ?, ?, ?)
+            """,
+            (version, now, "backfilling" if hasattr(module, "backfill") else "done", now),
+        )
 
+    def pending_backfills(self) -> list[int]:
+        rows = self.conn.execute(
+            "SELECT version FROM schema_migrations WHERE state = 'backfilling' ORDER BY version"
+        ).fetchall()
+        return [row["version"] for row in rows]
+
+    def run_backfills(
+        self,
+        *,
+        max_seconds: float | None = None,
+        busy_timeout_ms: int | None = None,
+        chunk_rows: int = BACKFILL_CHUNK_ROWS,
+    ) -> int:
+        # Always runs at least one chunk so every call makes progress. With
+        # busy_timeout_ms a contended chunk is skipped instead of waited for.
+        pending = self.pending_backfills()
+        if not pending:
+            return 0
+        files = {migration_version(path): path for path in migration_files()}
+        deadline = None if max_seconds is None else time.monotonic() + max_seconds
+        chunks = 0
         try:
-            existing_columns = {
-                row["name"]
-                for row in self.conn.execute("PRAGMA table_info(captures_fts)").fetchall()
+            for version in pending:
+                module = load_python_migration(files[version])
+                while True:
+                    if chunks and deadline is not None and time.monotonic() >= deadline:
+                        return chunks
+                    finished = self._run_backfill_chunk(
+                        version, module, busy_timeout_ms, chunk_rows
+                    )
+                    chunks += 1
+                    if finished:
+                        break
+        except sqlite3.OperationalError as exc:
+            if busy_timeout_ms is None or not is_busy_error(exc):
+                raise
+        return chunks
+
+    def _run_backfill_chunk(
+        self, version: int, module: ModuleType, busy_timeout_ms: int | None, chunk_rows: int
+    ) -> bool:
+        with self.write(busy_timeout_ms=busy_timeout_ms):
+            row = self.conn.execute(
+                "SELECT state, cursor FROM schema_migrations WHERE version = ?", (version,)
+            ).fetchone()
+            # Another process may have advanced or finished it while we waited.
+            if row["state"] != "backfilling":
+                return True
+            cursor, rows = module.backfill(self.conn, row["cursor"], chunk_rows)
+            self.conn.execute(
+                """
+                UPDATE schema_migrations
+                SET state = ?, cursor = coalesce(?, cursor), rows_done = rows_done + ?,
+                    updated_at = ?
+                WHERE version = ?
+                """,
+                (
+                    "done" if cursor is None else "backfilling",
+                    cursor,
+                    rows,
+                    int(time.time()),
+                    version,
+                ),
+            )
+        return cursor is None
+
+    def migration_status(self) -> list[dict[str, Any]]:
+        rows = {
+            row["version"]: dict(row)
+            for row in self.conn.execute("SELECT * FROM schema_migrations").fetchall()
+        }
+        report: list[dict[str, Any]] = []
+        for path in migration_files():
+            version = migration_version(path)
+            row = rows.get(version, {})
+            entry: dict[str, Any] = {
+                "version": version,
+                "name": path.stem.split("_", 1)[1],
+                "kind": path.suffix.lstrip("."),
+                "state": row.get("state", "pending"),
+                "applied_at": row.get("applied_at"),
+                "updated_at": row.get("updated_at"),
+                "rows_done": row.get("rows_done", 0),
+                "rows_remaining": None,
             }
-            if existing_columns and existing_columns != expected_columns:
-                with self.conn:
+            if entry["state"] == "backfilling":
+                module = load_python_migration(path)
+                if hasattr(module, "remaining"):
+                    entry["rows_remaining"] = module.remaining(self.conn, row["cursor"])
+            elif entry["state"] == "done":
+                entry["rows_remaining"] = 0
+            report.append(entry)
+        return report
+
+    def is_prepared(self) -> bool:
+        # Read-only counterpart of prepare(), for callers that may search a
+        # database but must not migrate it or take its write lock.
+        applied_versions = self.applied_migration_versions()
+        if any(migration_version(path) not in applied_versions for path in migration_files()):
+            return False
+        return self._fts_columns() == FTS_COLUMNS and self._fts_marked_synced()
+
+    def prepare(self, advance_backfills: bool = True) -> None:
+        self.configure()
+        self.run_migrations()
+        self.ensure_fts()
+        if not advance_backfills:
+            return
+        # Commands keep working while a backfill is in progress; each one just
+        # moves it along a little, never waiting on another writer to do so.
+        self.run_backfills(
+            max_seconds=BACKFILL_STEP_SECONDS, busy_timeout_ms=BACKFILL_BUSY_TIMEOUT_MS
+        )
+
+    def _fts_columns(self) -> set[str]:
+        return {
+            row["name"]
+            for row in self.conn.execute("PRAGMA table_info(captures_fts)").fetchall()
+        }
+
+    def _fts_marked_synced(self) -> bool:
+        row = self.conn.execute(
+            "SELECT 1 FROM ctx_meta WHERE key = ?", (FTS_SYNCED_KEY,)
+        ).fetchone()
+        return row is not None
+
+    def mark_fts_stale(self) -> None:
+        # Runs inside the caller's write transaction.
+        self.conn.execute("DELETE FROM ctx_meta WHERE key = ?", (FTS_SYNCED_KEY,))
+
+    def fts_alignment(self) -> dict[str, int]:
+        # Updates and deletes address FTS rows by captures rowid, which VACUUM
+        # may renumber, so matching counts alone are not enough.
+        row = self.conn.execute(
+            """
+            SELECT
+              (SELECT count(*) FROM captures) AS captures_count,
+              (SELECT count(*) FROM captures_fts) AS fts_count,
+              (
+                SELECT count(*) FROM captures_fts f
+                JOIN captures c ON c.rowid = f.rowid AND c.id = f.id
+              ) AS aligned_count
+            """
+        ).fetchone()
+        return dict(row)
+
+    def _fts_in_sync(self) -> bool:
+        counts = self.fts_alignment()
+        return counts["captures_count"] == counts["fts_count"] == counts["aligned_count"]
+
+    def ensure_fts(self) -> bool:
+        try:
+            # Captures and FTS are kept in sync on every write, so the common
+            # case is a single marker lookup with no counts and no write lock.
+            # Only migrations or a failed FTS write clear the marker.
+            if self._fts_columns() == FTS_COLUMNS and self._fts_marked_synced():
+                self.fts_available = True
+                return True
+
+            with self.write():
+                existing_columns = self._fts_columns()
+                if existing_columns and existing_columns != FTS_COLUMNS:
                     self.conn.execute("DROP TABLE IF EXISTS captures_fts")
 
-            with self.conn:
                 self.conn.execute(
                     """
                     CREATE VIRTUAL TABLE IF NOT EXISTS captures_fts USING fts5(
@@ -83,47 +485,56 @@ class Database:
                     )
                     """
                 )
-                self.conn.execute("DELETE FROM captures_fts")
-                self.conn.execute(
-                    """
-                    INSERT INTO captures_fts (
-                      id, file_name, file_path_at_capture, origin_title, origin_url, note
+                if not self._fts_in_sync():
+                    self.conn.execute("DELETE FROM captures_fts")
+                    self.conn.execute(
+                        """
+                        INSERT INTO captures_fts (
+                          rowid, id, file_name, file_path_at_capture, origin_title, origin_url, note
+                        )
+                        SELECT
+                          rowid,
+                          id,
+                          file_name,
+                          file_path_at_capture,
+                          origin_title,
+                          origin_url,
+                          coalesce(note, '')
+                        FROM captures
+                        """
                     )
-                    SELECT
-                      id,
-                      file_name,
-                      file_path_at_capture,
-                      origin_title,
-                      origin_url,
-                      coalesce(note, '')
-                    FROM captures
-                    """
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO ctx_meta(key, value) VALUES (?, ?)",
+                    (FTS_SYNCED_KEY, str(int(time.time()))),
                 )
+            self.fts_available = True
             return True
         except sqlite3.OperationalError:
+            self.fts_available = False
             return False
 
     def sync_fts_insert(self, record: dict[str, Any]) -> None:
+        # Runs inside the caller's write transaction, after the captures row exists.
         try:
-            with self.conn:
-                self.conn.execute(
-                    """
-                    INSERT INTO captures_fts (
-                      id, file_name, file_path_at_capture, origin_title, origin_url, note
-                    )
-                    VALUES (?, ?, ?, ?, ?, ?)
-                    """,
-                    (
-                        record["id"],
-                        record["file_name"],
-                        record["file_path_at_capture"],
-                        record["origin_title"],
-                        record["origin_url"],
-                        record.get("note") or "",
-                    ),
+            self.conn.execute(
+                """
+                INSERT INTO captures_fts (
+                  rowid, id, file_name, file_path_at_capture, origin_title, origin_url, note
                 )
+                VALUES ((SELECT rowid FROM captures WHERE id = ?), ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    record["id"],
+                    record["id"],
+                    record["file_name"],
+                    record["file_path_at_capture"],
+                    record["origin_title"],
+                    record["origin_url"],
+                    record.get("note") or "",
+                ),
+            )
         except sqlite3.OperationalError:
-            pass
+            self.mark_fts_stale()
 
     def insert_capture(
         self,
@@ -138,6 +549,7 @@ class Database:
         browser: str = "safari",
         source_app: str | None = None,
         mime_type: str | None = None,
+        file_fingerprint: str | None = None,
     ) -> dict[str, Any]:
         record = {
             "id": str(uuid.uuid4()),
@@ -148,19 +560,21 @@ class Database:
             "file_path_at_capture": file_path_at_capture,
             "origin_title": origin_title,
             "origin_url": origin_url,
+            "origin_host": normalize_host(origin_url),
             "note": note,
             "browser": browser,
             "source_app": source_app,
             "mime_type": mime_type,
+            "file_fingerprint": file_fingerprint,
         }
-        with self.conn:
+        with self.write():
             self.conn.execute(
                 """
                 INSERT INTO captures (
                   id, created_at, file_hash, file_name, file_size_bytes,
-                  file_path_at_capture, origin_title, origin_url, note,
-                  browser, source_app, mime_type
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                  file_path_at_capture, origin_title, origin_url, origin_host, note,
+                  browser, source_app, mime_type, file_fingerprint
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                 """,
                 (
                     record["id"],
@@ -171,95 +585,264 @@ class Database:
                     record["file_path_at_capture"],
                     record["origin_title"],
                     record["origin_url"],
+                    record["origin_host"],
                     record["note"],
                     record["browser"],
                     record["source_app"],
                     record["mime_type"],
+                    record["file_fingerprint"],
                 ),
             )
-
-        self.sync_fts_insert(record)
+            self.sync_fts_insert(record)
         return record
 
     def lookup_by_hash(self, file_hash: str, limit: int = 20) -> list[dict[str, Any]]:
-        rows = self.conn.execute(
-            """
-            SELECT * FROM captures
-            WHERE file_hash = ?
-            ORDER BY created_at DESC
-            LIMIT ?
-            """,
-            (file_hash, limit),
-        ).fetchall()
-        return [dict(row) for row in rows]
+        return list(self.iter_lookup_by_hash(file_hash, limit=limit))
+
+    def iter_lookup_by_hash(self, file_hash: str, limit: int = 20) -> Iterator[dict[str, Any]]:
+        cursor = self.conn.execute(LOOKUP_BY_HASH_SQL, (file_hash, limit))
+        return (dict(row) for row in cursor)
+
+    def has_size_fingerprint_candidate(self, file_size_bytes: int, file_fingerprint: str) -> bool:
+        row = self.conn.execute(
+            SIZE_FINGERPRINT_PROBE_SQL, (file_size_bytes, file_fingerprint)
+        ).fetchone()
+        return row is not None
 
-    def refresh_observed_file_location(self, file_hash: str, observed_path: str) -> None:
+    def refresh_observed_file_location(
+        self,
+        file_hash: str,
+        observed_path: str,
+        file_fingerprint: str | None = None,
+    ) -> None:
         observed_name = Path(observed_path).name
-        with self.conn:
+        with self.write():
             self.conn.execute(
-                """
-                UPDATE captures
-                SET file_name = ?, file_path_at_capture = ?
-                WHERE file_hash = ?
-                """,
-                (observed_name, observed_path, file_hash),
+                REFRESH_LOCATION_SQL,
+                (observed_name, observed_path, file_fingerprint, file_hash),
             )
-        try:
-            with self.conn:
+            try:
                 self.conn.execute(
-                    """
-                    UPDATE captures_fts
-                    SET file_name = ?, file_path_at_capture = ?
-                    WHERE id IN (
-                      SELECT id FROM captures WHERE file_hash = ?
-                    )
-                    """,
-                    (observed_name, observed_path, file_hash),
+                    REFRESH_FTS_LOCATION_SQL, (observed_name, observed_path, file_hash)
                 )
-        except sqlite3.OperationalError:
-            pass
+            except sqlite3.OperationalError:
+                self.mark_fts_stale()
 
     def search_captures(self, query: str, limit: int = 20) -> tuple[list[dict[str, Any]], str]:
+        records, backend = self.iter_search_captures(query, limit=limit)
+        return list(records), backend
+
+    def iter_search_captures(
+        self, query: str, limit: int = 20
+    ) -> tuple[Iterator[dict[str, Any]], str]:
+        # Rows are produced straight from the cursor; only the first FTS row is
+        # fetched eagerly to decide whether to fall back to LIKE matching.
         if query.strip() == "":
-            rows = self.conn.execute(
-                "SELECT * FROM captures ORDER BY created_at DESC LIMIT ?", (limit,)
-            ).fetchall()
-            return [dict(row) for row in rows], "recent"
+            cursor = self.conn.execute(SEARCH_RECENT_SQL, (limit,))
+            return (dict(row) for row in cursor), "recent"
 
         try:
-            rows = self.conn.execute(
-                """
-                SELECT c.* FROM captures_fts f
-                JOIN captures c ON c.id = f.id
-                WHERE captures_fts MATCH ?
-                ORDER BY c.created_at DESC
-                LIMIT ?
-                """,
-                (query, limit),
-            ).fetchall()
-            if rows:
-                return [dict(row) for row in rows], "fts5"
+            cursor = self.conn.execute(SEARCH_FTS_SQL, (query, limit))
+            first = cursor.fetchone()
+            if first is not None:
+                return (dict(row) for row in chain([first], cursor)), "fts5"
         except sqlite3.OperationalError:
             pass
 
         like_q = f"%{query.lower()}%"
+        cursor = self.conn.execute(
+            SEARCH_LIKE_SQL, (like_q, like_q, like_q, like_q, like_q, limit)
+        )
+        return (dict(row) for row in cursor), "like"
+
+    def record_relocation_hit(self, dir_path: str) -> None:
+        now = int(time.time())
+        with self.write():
+            row = self.conn.execute(
+                "SELECT score, last_hit_at FROM relocation_hits WHERE dir_path = ?",
+                (dir_path,),
+            ).fetchone()
+            score = 1.0
+            if row:
+                score += decayed_score(row["score"], row["last_hit_at"], now)
+            self.conn.execute(
+                """
+                INSERT INTO relocation_hits(dir_path, hits, score, last_hit_at)
+                VALUES (?, 1, ?, ?)
+                ON CONFLICT(dir_path) DO UPDATE SET
+                  hits = hits + 1,
+                  score = excluded.score,
+                  last_hit_at = excluded.last_hit_at
+                """,
+                (dir_path, score, now),
+            )
+            self.conn.execute(
+                """
+                DELETE FROM relocation_hits
+                WHERE dir_path NOT IN (
+                  SELECT dir_path FROM relocation_hits
+                  ORDER BY last_hit_at DESC
+                  LIMIT ?
+                )
+                """,
+                (MAX_RELOCATION_HIT_DIRS,),
+            )
+
+    def relocation_hits(self) -> list[dict[str, Any]]:
         rows = self.conn.execute(
+            "SELECT dir_path, hits, score, last_hit_at FROM relocation_hits"
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def reset_relocation_hits(self) -> int:
+        with self.write():
+            cursor = self.conn.execute("DELETE FROM relocation_hits")
+        return cursor.rowcount
+
+    def record_metrics(self, metrics: list[dict[str, Any]], max_rows: int) -> None:
+        # Tried once; the caller keeps samples that can't get the lock in time.
+        with self.write(busy_timeout_ms=METRICS_BUSY_TIMEOUT_MS):
+            last_id = None
+            for metric in metrics:
+                last_id = self.conn.execute(
+                    """
+                    INSERT INTO command_metrics (
+                      recorded_at, command, backend, outcome, duration_ms,
+                      bytes_hashed, reconciled, reconcile_timeouts
+                    ) VALUES (
+                      :recorded_at, :command, :backend, :outcome, :duration_ms,
+                      :bytes_hashed, :reconciled, :reconcile_timeouts
+                    )
+                    """,
+                    metric,
+                ).lastrowid
+            if last_id is None:
+                return
+            # Ring behaviour: ids only grow, so trimming is one primary-key range delete.
+            self.conn.execute(
+                "DELETE FROM command_metrics WHERE id <= ?",
+                (last_id - max_rows,),
+            )
+
+    def iter_metrics(
+        self, since: int | None = None, command: str | None = None
+    ) -> Iterator[dict[str, Any]]:
+        cursor = self.conn.execute(
             """
-            SELECT * FROM captures
-            WHERE lower(file_name) LIKE ?
-               OR lower(file_path_at_capture) LIKE ?
-               OR lower(origin_title) LIKE ?
-               OR lower(origin_url) LIKE ?
-               OR lower(coalesce(note, '')) LIKE ?
-            ORDER BY created_at DESC
-            LIMIT ?
+            SELECT * FROM command_metrics
+            WHERE (? IS NULL OR recorded_at >= ?)
+              AND (? IS NULL OR command = ?)
+            ORDER BY command, coalesce(backend, ''), duration_ms
             """,
-            (like_q, like_q, like_q, like_q, like_q, limit),
-        ).fetchall()
-        return [dict(row) for row in rows], "like"
+            (since, since, command, command),
+        )
+        return (dict(row) for row in cursor)
 
-    def get_capture_by_id(self, capture_id: str) -> dict[str, Any] | None:
+    def rebuild_fts(self) -> None:
+        with self.write():
+            self.mark_fts_stale()
+        self.ensure_fts()
+
+    def fts_optimize(self) -> None:
+        with self.write():
+            self.conn.execute("INSERT INTO captures_fts(captures_fts) VALUES ('optimize')")
+
+    def checkpoint_wal(self) -> dict[str, int]:
+        row = retry_busy(lambda: self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone())
+        return {"busy": row[0], "log_frames": row[1], "checkpointed_frames": row[2]}
+
+    def incremental_vacuum(self, pages: int = 0) -> int:
+        # Only reclaims pages when auto_vacuum=INCREMENTAL; 0 frees the whole freelist.
+        before = self.conn.execute("PRAGMA freelist_count").fetchone()[0]
+        with self.write():
+            self.conn.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+        after = self.conn.execute("PRAGMA freelist_count").fetchone()[0]
+        return before - after
+
+    def fts_merge(self, pages: int) -> bool:
+        # One bounded merge step; FTS5 reports work done as >= 2 total changes.
+        with self.write():
+            before = self.conn.total_changes
+            self.conn.execute(
+                "INSERT INTO captures_fts(captures_fts, rank) VALUES ('merge', ?)",
+                (int(pages),),
+            )
+            return self.conn.total_changes - before >= 2
+
+    def enable_incremental_vacuum(self) -> bool:
+        if self.conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            return False
+        self.conn.execute("PRAGMA auto_vacuum=INCREMENTAL;")
+        # Switching from NONE only takes effect after a full VACUUM.
+        retry_busy(lambda: self.conn.execute("VACUUM"))
+        # VACUUM may renumber captures rowids (there is no INTEGER PRIMARY KEY),
+        # so rebuild captures_fts to keep its rowids aligned.
+        with self.write():
+            self.conn.execute("DROP TABLE IF EXISTS captures_fts")
+            self.mark_fts_stale()
+        self.ensure_fts()
+        return True
+
+    def captures_page(self, after: tuple[int, str], limit: int) -> list[dict[str, Any]]:
+        rows = self.conn.execute(CAPTURES_PAGE_SQL, (*after, limit)).fetchall()
+        return [dict(row) for row in rows]
+
+    def keep_latest_boundary(self, keep: int) -> tuple[int, str] | None:
+        # Key of the oldest row among the newest `keep`; older rows fall outside.
         row = self.conn.execute(
-            "SELECT * FROM captures WHERE id = ? LIMIT 1", (capture_id,)
+            "SELECT created_at, id FROM captures ORDER BY created_at DESC, id DESC LIMIT 1 OFFSET ?",
+            (keep - 1,),
         ).fetchone()
+        return (row["created_at"], row["id"]) if row else None
+
+    def archive_captures(self, records: list[dict[str, Any]]) -> int:
+        # Idempotent, so a batch interrupted before its delete is safe to re-run.
+        archived = 0
+        with self.write():
+            for record in records:
+                cursor = self.conn.execute(
+                    """
+                    INSERT OR IGNORE INTO captures (
+                      id, created_at, file_hash, file_name, file_size_bytes,
+                      file_path_at_capture, origin_title, origin_url, origin_host, note,
+                      browser, source_app, mime_type, file_fingerprint
+                    ) VALUES (
+                      :id, :created_at, :file_hash, :file_name, :file_size_bytes,
+                      :file_path_at_capture, :origin_title, :origin_url, :origin_host, :note,
+                      :browser, :source_app, :mime_type, :file_fingerprint
+                    )
+                    """,
+                    # The source row may predate the origin_host backfill.
+                    {
+                        **record,
+                        "origin_host": record.get("origin_host")
+                        or normalize_host(record["origin_url"]),
+                    },
+                )
+                if cursor.rowcount == 1:
+                    self.sync_fts_insert(record)
+                    archived += 1
+        return archived
+
+    def delete_captures(self, capture_ids: list[str]) -> int:
+        placeholders = ", ".join("?" for _ in capture_ids)
+        with self.write():
+            try:
+                self.conn.execute(
+                    f"""
+                    DELETE FROM captures_fts WHERE rowid IN (
+                      SELECT rowid FROM captures WHERE id IN ({placeholders})
+                    )
+                    """,
+                    capture_ids,
+                )
+            except sqlite3.OperationalError:
+                self.mark_fts_stale()
+            cursor = self.conn.execute(
+                f"DELETE FROM captures WHERE id IN ({placeholders})", capture_ids
+            )
+        return cursor.rowcount
+
+    def get_capture_by_id(self, capture_id: str) -> dict[str, Any] | None:
+        row = self.conn.execute(GET_CAPTURE_SQL, (capture_id,)).fetchone()
         return dict(row) if row else None
@@ -0,0 +1,217 @@
+from __future__ import annotations
+
+import re
+import sqlite3
+from pathlib import Path
+from typing import Any
+
+from ctx_core.db import HOT_QUERIES, Database
+
+REPAIR_ACTIONS = ("fts-optimize", "fts-rebuild", "wal-checkpoint", "incremental-vacuum")
+
+WAL_WARN_BYTES = 64 * 1024 * 1024
+FTS_SEGMENT_WARN_COUNT = 16
+FREELIST_WARN_RATIO = 0.25
+
+AUTO_VACUUM_MODES = {0: "none", 1: "full", 2: "incremental"}
+
+# A virtual-table scan with an empty idxStr (e.g. "INDEX 0:") has no usable
+# constraint and reads the whole table.
+_VIRTUAL_FULL_SCAN = re.compile(r"VIRTUAL TABLE INDEX \d+:$")
+
+# Plan steps that are full scans or sorts by shape but bounded by design; they
+# are reported as notes, not warnings.
+EXPECTED_PLAN_STEPS: dict[str, dict[str, str]] = {
+    "search_recent": {
+        "SCAN captures USING INDEX idx_captures_created_at": "Reads captures newest "
+        "first in index order and stops after LIMIT rows.",
+    },
+    "search_fts": {
+        "USE TEMP B-TREE FOR ORDER BY": "FTS matches are sorted by created_at; "
+        "the sort is bounded by the number of matches.",
+    },
+    "search_like": {
+        "SCAN captures USING INDEX idx_captures_created_at": "LIKE is the fallback when "
+        "FTS finds nothing; it reads captures newest first until LIMIT rows match.",
+    },
+}
+
+
+def file_size(path: Path) -> int | None:
+    try:
+        return path.stat().st_size
+    except OSError:
+        return None
+
+
+def pragma_value(db: Database, name: str) -> Any:
+    return db.conn.execute(f"PRAGMA {name}").fetchone()[0]
+
+
+def is_full_scan(detail: str) -> bool:
+    # Only SEARCH steps are bounded by an index. A SCAN walks the whole table,
+    # in index order or not, and a temp b-tree sorts every row it is given;
+    # bounded exceptions are listed in EXPECTED_PLAN_STEPS.
+    if detail.startswith("USE TEMP B-TREE"):
+        return True
+    if not detail.startswith("SCAN "):
+        return False
+    if "VIRTUAL TABLE" in detail:
+        # Virtual tables always report SCAN; a constrained one is an index lookup.
+        return bool(_VIRTUAL_FULL_SCAN.search(detail))
+    return True
+
+
+def database_report(db: Database) -> dict[str, Any]:
+    page_size = pragma_value(db, "page_size")
+    page_count = pragma_value(db, "page_count")
+    return {
+        "path": str(db.db_path),
+        "sqlite_version": sqlite3.sqlite_version,
+        "journal_mode": pragma_value(db, "journal_mode"),
+        "auto_vacuum": AUTO_VACUUM_MODES.get(pragma_value(db, "auto_vacuum"), "unknown"),
+        "page_size": page_size,
+        "page_count": page_count,
+        "freelist_pages": pragma_value(db, "freelist_count"),
+        "db_bytes": file_size(db.db_path),
+        "wal_bytes": file_size(Path(f"{db.db_path}-wal")),
+        "shm_bytes": file_size(Path(f"{db.db_path}-shm")),
+        "captures_rows": db.conn.execute("SELECT count(*) FROM captures").fetchone()[0],
+    }
+
+
+def fts_report(db: Database) -> dict[str, Any]:
+    report: dict[str, Any] = {
+        "available": bool(db.fts_available),
+        "rows": None,
+        "misaligned_rows": None,
+        "segments": None,
+        "bytes": None,
+    }
+    if not db.fts_available:
+        return report
+
+    alignment = db.fts_alignment()
+    report["rows"] = alignment["fts_count"]
+    report["misaligned_rows"] = alignment["fts_count"] - alignment["aligned_count"]
+    report["segments"] = db.conn.execute(
+        "SELECT count(DISTINCT segid) FROM captures_fts_idx"
+    ).fetchone()[0]
+    try:
+        report["bytes"] = db.conn.execute(
+            "SELECT sum(pgsize) FROM dbstat WHERE name LIKE 'captures_fts%'"
+        ).fetchone()[0]
+    except sqlite3.OperationalError:
+        # dbstat is an optional compile-time module.
+        pass
+    return report
+
+
+def query_plans(db: Database) -> list[dict[str, Any]]:
+    plans: list[dict[str, Any]] = []
+    for name, (sql, params) in HOT_QUERIES.items():
+        try:
+            rows = db.conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+        except sqlite3.OperationalError as exc:
+            plans.append({"query": name, "plan": [], "full_scans": [], "error": str(exc)})
+            continue
+        details = [row["detail"] for row in rows]
+        expected = EXPECTED_PLAN_STEPS.get(name, {})
+        plan: dict[str, Any] = {
+            "query": name,
+            "plan": details,
+            "full_scans": [
+                detail for detail in details if is_full_scan(detail) and detail not in expected
+            ],
+        }
+        notes = [expected[detail] for detail in details if detail in expected]
+        if notes:
+            plan["notes"] = notes
+        plans.append(plan)
+    return plans
+
+
+def collect_warnings(
+    database: dict[str, Any], fts: dict[str, Any], plans: list[dict[str, Any]]
+) -> list[str]:
+    warnings: list[str] = []
+    if not fts["available"]:
+        warnings.append("FTS5 is unavailable; search falls back to LIKE full scans.")
+    elif fts["rows"] != database["captures_rows"]:
+        warnings.append(
+            f"FTS rows ({fts['rows']}) differ from captures rows ({database['captures_rows']})."
+        )
+    if fts["misaligned_rows"]:
+        warnings.append(
+            f"{fts['misaligned_rows']} FTS rows do not match their captures rowid; "
+            "run --repair fts-rebuild."
+        )
+    if fts["segments"] is not None and fts["segments"] > FTS_SEGMENT_WARN_COUNT:
+        warnings.append(
+            f"FTS index has {fts['segments']} segments; run --repair fts-optimize."
+        )
+    if (database["wal_bytes"] or 0) > WAL_WARN_BYTES:
+        warnings.append(
+            f"WAL is {database['wal_bytes']} bytes; run --repair wal-checkpoint."
+        )
+    if (
+        database["page_count"]
+        and database["freelist_pages"] / database["page_count"] > FREELIST_WARN_RATIO
+    ):
+        remedy = (
+            "run --repair incremental-vacuum."
+            if database["auto_vacuum"] == "incremental"
+            else "run `ctx-core compact --enable-incremental-vacuum`."
+        )
+        warnings.append(
+            f"{database['freelist_pages']} of {database['page_count']} pages are free; {remedy}"
+        )
+    for plan in plans:
+        for detail in plan["full_scans"]:
+            warnings.append(f"Query {plan['query']} is not bounded by an index: {detail}")
+        if plan.get("error"):
+            warnings.append(f"Query {plan['query']} cannot be planned: {plan['error']}")
+    return warnings
+
+
+def collect_notes(plans: list[dict[str, Any]]) -> list[str]:
+    return [f"Query {plan['query']}: {note}" for plan in plans for note in plan.get("notes", [])]
+
+
+def run_repairs(db: Database, actions: list[str]) -> list[dict[str, Any]]:
+    results: list[dict[str, Any]] = []
+    for action in dict.fromkeys(actions):
+        if action == "fts-optimize":
+            if not db.fts_available:
+                results.append({"action": action, "skipped": "FTS5 is unavailable."})
+                continue
+            db.fts_optimize()
+            results.append({"action": action})
+        elif action == "fts-rebuild":
+            db.rebuild_fts()
+            results.append({"action": action, "available": bool(db.fts_available)})
+        elif action == "wal-checkpoint":
+            results.append({"action": action, **db.checkpoint_wal()})
+        elif action == "incremental-vacuum":
+            if pragma_value(db, "auto_vacuum") != 2:
+                results.append(
+                    {"action": action, "skipped": "auto_vacuum is not INCREMENTAL."}
+                )
+                continue
+            results.append({"action": action, "freed_pages": db.incremental_vacuum()})
+    return results
+
+
+def diagnose(db: Database, repairs: list[str] | None = None) -> dict[str, Any]:
+    repaired = run_repairs(db, repairs or [])
+    database = database_report(db)
+    fts = fts_report(db)
+    plans = query_plans(db)
+    return {
+        "database": database,
+        "fts": fts,
+        "queries": plans,
+        "warnings": collect_warnings(database, fts, plans),
+        "notes": collect_notes(plans),
+        "repairs": repaired,
+    }
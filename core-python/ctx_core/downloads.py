@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import time
+from collections.abc import Generator
 from dataclasses import dataclass
 from pathlib import Path
 
@@ -30,13 +31,15 @@ def _is_temp_file(path: Path) -> bool:
     return any(lower_name.endswith(suffix) for suffix in TEMP_SUFFIXES)
 
 
-def _is_stable(
+def stability_samples(
     path: Path,
     *,
     checks: int = STABILITY_CHECKS,
     sleep_seconds: float = STABILITY_SLEEP_SECONDS,
     min_quiet_seconds: float = MIN_QUIET_SECONDS,
-) -> bool:
+) -> Generator[float, None, bool]:
+    # Yields how long to wait before each re-check and returns the verdict, so
+    # the blocking and asyncio callers share one sampling policy.
     try:
         previous = path.stat()
     except OSError:
@@ -46,7 +49,7 @@ def _is_stable(
         return False
 
     for _ in range(checks):
-        time.sleep(sleep_seconds)
+        yield sleep_seconds
         try:
             current = path.stat()
         except OSError:
@@ -60,13 +63,23 @@ def _is_stable(
     return True
 
 
-def find_newest_stable_download(downloads_dir: Path, within_seconds: int) -> CandidateResult:
+def _is_stable(path: Path) -> bool:
+    samples = stability_samples(path)
+    try:
+        while True:
+            time.sleep(next(samples))
+    except StopIteration as done:
+        return done.value
+
+
+def recent_candidates(downloads_dir: Path, within_seconds: int) -> list[Path]:
+    # Non-temp files modified within the window, newest first.
     now = time.time()
     cutoff = now - within_seconds
     candidates: list[Path] = []
 
     if not downloads_dir.exists() or not downloads_dir.is_dir():
-        return CandidateResult(path=None, had_candidates=False)
+        return candidates
 
     for path in downloads_dir.iterdir():
         if not path.is_file():
@@ -82,7 +95,11 @@ def find_newest_stable_download(downloads_dir: Path, within_seconds: int) -> Can
         candidates.append(path)
 
     candidates.sort(key=lambda p: p.stat().st_mtime, reverse=True)
+    return candidates
+
 
+def find_newest_stable_download(downloads_dir: Path, within_seconds: int) -> CandidateResult:
+    candidates = recent_candidates(downloads_dir, within_seconds)
     if not candidates:
         return CandidateResult(path=None, had_candidates=False)
 
@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import json
+import struct
+from collections.abc import Iterable, Iterator
+from typing import Any
+
+# Big-endian uint32 payload length before every framed message.
+FRAME_HEADER = struct.Struct(">I")
+
+
+def parse_fields(value: str) -> list[str]:
+    return [name.strip() for name in value.split(",") if name.strip()]
+
+
+def project_records(
+    records: Iterable[dict[str, Any]], fields: list[str]
+) -> Iterator[dict[str, Any]]:
+    for record in records:
+        yield {name: record.get(name) for name in fields}
+
+
+def project_update(update: dict[str, Any], fields: list[str] | None) -> dict[str, Any]:
+    # Unlike records, updates only carry the fields that changed, plus "id".
+    if not fields:
+        return update
+    return {name: value for name, value in update.items() if name == "id" or name in fields}
+
+
+class ColumnTable:
+    """Turns records into rows of values in a shared field order.
+
+    With no projection the field list starts from the first record and only
+    ever grows at the end, so earlier rows stay valid as a prefix.
+    """
+
+    def __init__(self, fields: list[str] | None = None) -> None:
+        self.fields = list(fields or [])
+        self.fixed = fields is not None
+        self._known = set(self.fields)
+
+    def row(self, record: dict[str, Any]) -> tuple[list[Any], bool]:
+        grew = False
+        if not self.fixed:
+            for name in record:
+                if name not in self._known:
+                    self._known.add(name)
+                    self.fields.append(name)
+                    grew = True
+        return [record.get(name) for name in self.fields], grew
+
+
+def compact_json(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def frame(value: Any) -> bytes:
+    payload = compact_json(value).encode("utf-8")
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+
+def iter_frames(data: bytes) -> Iterator[Any]:
+    offset = 0
+    while offset < len(data):
+        (length,) = FRAME_HEADER.unpack_from(data, offset)
+        offset += FRAME_HEADER.size
+        yield json.loads(data[offset : offset + length].decode("utf-8"))
+        offset += length
@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+import time
+from collections.abc import AsyncIterator, Callable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, TypeVar
+
+from ctx_core.db import Database
+from ctx_core.downloads import recent_candidates, stability_samples
+from ctx_core.errors import CtxError
+from ctx_core.hashing import sampled_fingerprint, sha256_file
+from ctx_core.reconcile import ScanStats, find_file_by_hash
+
+T = TypeVar("T")
+
+IO_WORKERS = min(8, (os.cpu_count() or 1) + 2)
+
+
+@dataclass
+class HashedFile:
+    path: Path
+    size: int
+    mtime_ns: int
+    file_hash: str
+    file_fingerprint: str
+
+
+def hash_file(path: Path, cancel: threading.Event | None = None) -> HashedFile:
+    before = path.stat()
+    file_hash = sha256_file(path, cancel)
+    return HashedFile(
+        path=path,
+        size=before.st_size,
+        mtime_ns=before.st_mtime_ns,
+        file_hash=file_hash,
+        file_fingerprint=sampled_fingerprint(path, before.st_size),
+    )
+
+
+async def is_stable(path: Path) -> bool:
+    samples = stability_samples(path)
+    try:
+        while True:
+            await asyncio.sleep(next(samples))
+    except StopIteration as done:
+        return done.value
+
+
+class AsyncEngine:
+    """Runs blocking ctx-core work off the event loop.
+
+    The Database is opened and used on one dedicated thread, so every query and
+    write is serialized through it; hashing and directory scans run on a
+    separate pool and overlap with each other and with DB work.
+    """
+
+    def __init__(self, db_path: Path | None = None, io_workers: int = IO_WORKERS) -> None:
+        self._db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ctx-db")
+        self._io_executor = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix="ctx-io")
+        self._db_path = db_path
+        self.db: Database | None = None
+
+    async def open(self) -> None:
+        if self.db is not None:
+            return
+
+        def connect() -> Database:
+            db = Database(self._db_path)
+            try:
+                db.prepare()
+            except Exception:
+                db.close()
+                raise
+            return db
+
+        self.db = await self._run(self._db_executor, connect)
+
+    async def close(self) -> None:
+        if self.db is not None:
+            await self.run_db(lambda db: db.close())
+            self.db = None
+        self._io_executor.shutdown(wait=False, cancel_futures=True)
+        self._db_executor.shutdown(wait=True)
+
+    async def __aenter__(self) -> AsyncEngine:
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        await self.close()
+
+    async def _run(self, executor: ThreadPoolExecutor, operation: Callable[[], T]) -> T:
+        return await asyncio.get_running_loop().run_in_executor(executor, operation)
+
+    async def run_db(self, operation: Callable[[Database], T]) -> T:
+        db = self.db
+        assert db is not None, "AsyncEngine is not open"
+        return await self._run(self._db_executor, lambda: operation(db))
+
+    async def run_io(self, operation: Callable[[], T]) -> T:
+        return await self._run(self._io_executor, operation)
+
+    async def stable_hashed_download(self, downloads_dir: Path, within_seconds: int) -> HashedFile:
+        candidates = await self.run_io(lambda: recent_candidates(downloads_dir, within_seconds))
+        if not candidates:
+            raise CtxError(
+                code="NO_RECENT_DOWNLOAD",
+                message=f"No file created in Downloads within last {within_seconds} seconds.",
+            )
+
+        for path in candidates:
+            # Hash while stability is being sampled; a file that turns out to be
+            # still changing cancels its hash between chunks.
+            cancel = threading.Event()
+            hashing = asyncio.ensure_future(self.run_io(lambda: hash_file(path, cancel)))
+            try:
+                stable = await is_stable(path)
+                if not stable:
+                    continue
+                hashed = await hashing
+                current = path.stat()
+                if (current.st_size, current.st_mtime_ns) != (hashed.size, hashed.mtime_ns):
+                    # Changed after hashing started but settled since; hash the final bytes.
+                    hashed = await self.run_io(lambda: hash_file(path))
+                return hashed
+            except OSError as exc:
+                raise CtxError(
+                    code="HASH_ERROR",
+                    message="Failed to hash file.",
+                    details={"path": str(path), "reason": str(exc)},
+                ) from exc
+            finally:
+                if not hashing.done():
+                    cancel.set()
+                await asyncio.gather(hashing, return_exceptions=True)
+
+        raise CtxError(
+            code="DOWNLOAD_NOT_STABLE",
+            message="Download not stable yet.",
+        )
+
+    async def locate_files(
+        self,
+        records: list[dict[str, Any]],
+        *,
+        scan_roots: list[Path],
+        dir_priorities: dict[str, float],
+        max_seconds: float,
+        max_candidates: int,
+    ) -> AsyncIterator[tuple[dict[str, Any], str | None, ScanStats]]:
+        # Scans run concurrently on the I/O pool and are yielded as they finish.
+        # All of them share one deadline, including scans still queued for a thread.
+        deadline = time.monotonic() + max_seconds
+
+        def scan(record: dict[str, Any]) -> tuple[dict[str, Any], str | None, ScanStats]:
+            stats = ScanStats()
+            located = find_file_by_hash(
+                file_hash=record["file_hash"],
+                file_size_bytes=record["file_size_bytes"],
+                scan_roots=scan_roots,
+                max_seconds=max(0.0, deadline - time.monotonic()),
+                max_candidates=max_candidates,
+                file_fingerprint=record.get("file_fingerprint"),
+                dir_priorities=dir_priorities,
+                stats=stats,
+            )
+            return record, str(located) if located else None, stats
+
+        tasks = [asyncio.ensure_future(self.run_io(lambda r=record: scan(r))) for record in records]
+        try:
+            for finished in asyncio.as_completed(tasks, timeout=max_seconds + 1.0):
+                yield await finished
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
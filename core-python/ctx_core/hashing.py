@@ -1,17 +1,64 @@
 from __future__ import annotations
 
 import hashlib
+import threading
 from pathlib import Path
 
 CHUNK_SIZE = 1024 * 1024
+FINGERPRINT_SAMPLE_SIZE = 16 * 1024
+FINGERPRINT_SAMPLES = 3
 
+# Process-wide count of bytes fed to sha256, reported in command metrics.
+# The async engine hashes on several threads at once, hence the lock.
+_bytes_hashed = 0
+_bytes_hashed_lock = threading.Lock()
 
-def sha256_file(path: Path) -> str:
+
+def bytes_hashed() -> int:
+    return _bytes_hashed
+
+
+def _count_hashed(size: int) -> None:
+    global _bytes_hashed
+    with _bytes_hashed_lock:
+        _bytes_hashed += size
+
+
+class HashCancelled(Exception):
+    pass
+
+
+def sha256_file(path: Path, cancel: threading.Event | None = None) -> str:
+    # `cancel` lets a caller on another thread stop a hash between chunks.
     digest = hashlib.sha256()
     with path.open("rb") as handle:
         while True:
+            if cancel is not None and cancel.is_set():
+                raise HashCancelled(str(path))
             chunk = handle.read(CHUNK_SIZE)
             if not chunk:
                 break
             digest.update(chunk)
+            _count_hashed(len(chunk))
+    return digest.hexdigest()
+
+
+def sampled_fingerprint(path: Path, file_size_bytes: int | None = None) -> str:
+    # Size plus head/middle/tail samples; small files are read whole. Used as an
+    # indexed prefilter so negative lookups never pay for a full sha256 pass.
+    size = path.stat().st_size if file_size_bytes is None else file_size_bytes
+    digest = hashlib.sha256()
+    digest.update(str(size).encode("ascii"))
+    with path.open("rb") as handle:
+        if size <= FINGERPRINT_SAMPLE_SIZE * FINGERPRINT_SAMPLES:
+            samples = [handle.read()]
+        else:
+            last = size - FINGERPRINT_SAMPLE_SIZE
+            samples = []
+            for index in range(FINGERPRINT_SAMPLES):
+                handle.seek(last * index // (FINGERPRINT_SAMPLES - 1))
+                samples.append(handle.read(FINGERPRINT_SAMPLE_SIZE))
+    for sample in samples:
+        digest.update(sample)
+        _count_hashed(len(sample))
     return digest.hexdigest()
@@ -4,15 +4,51 @@ import argparse
 import json
 import mimetypes
 import sys
+import time
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Any
 
 from ctx_core import SCHEMA_VERSION
-from ctx_core.db import Database
+from ctx_core.db import Database, is_busy_error
+from ctx_core.doctor import REPAIR_ACTIONS, diagnose
 from ctx_core.downloads import find_newest_stable_download
+from ctx_core.encoding import (
+    ColumnTable,
+    compact_json,
+    frame,
+    parse_fields,
+    project_records,
+    project_update,
+)
 from ctx_core.errors import CtxError
-from ctx_core.hashing import sha256_file
-from ctx_core.reconcile import find_file_by_hash, resolve_scan_roots
+from ctx_core.hashing import sampled_fingerprint, sha256_file
+from ctx_core.metrics import (
+    DEFAULT_WINDOWS,
+    CommandMetrics,
+    flush_spool,
+    record_command,
+    summarize,
+)
+from ctx_core.reconcile import (
+    ScanStats,
+    decayed_score,
+    directory_priorities,
+    find_file_by_hash,
+    resolve_scan_roots,
+)
+from ctx_core.retention import (
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_COMPACT_SECONDS,
+    DEFAULT_MERGE_PAGES,
+    DEFAULT_RETAIN_SECONDS,
+    DEFAULT_VACUUM_PAGES,
+    build_policy,
+    compact,
+    iter_archive_search,
+    retain,
+)
 
 
 def ok(data: dict[str, Any]) -> dict[str, Any]:
@@ -39,6 +75,174 @@ def emit(payload: dict[str, Any]) -> None:
     print(json.dumps(payload, ensure_ascii=False))
 
 
+OUTPUT_FORMATS = ("json", "ndjson", "columnar", "columnar-framed")
+ENGINES = ("sync", "async")
+
+
+@dataclass
+class RecordStream:
+    command: str
+    header: dict[str, Any]
+    records: Iterable[dict[str, Any]]
+    # Filled in while `records` is consumed; reported in the trailer line.
+    summary: dict[str, Any] = field(default_factory=dict)
+    # Produced after the records, e.g. relocated search results: each carries
+    # the record's "id" and the fields that changed. None when there are none.
+    updates: Iterable[dict[str, Any]] | None = None
+
+
+def emit_line(payload: dict[str, Any]) -> None:
+    sys.stdout.write(json.dumps(payload, ensure_ascii=False) + "\n")
+    sys.stdout.flush()
+
+
+def streams_records(args: argparse.Namespace) -> bool:
+    # Every format except the JSON envelope is built from a RecordStream.
+    return args.output != "json"
+
+
+def check_fields(args: argparse.Namespace) -> None:
+    # The JSON envelope is never projected; don't let --fields be silently ignored.
+    if args.fields and not streams_records(args):
+        raise CtxError(
+            code="INVALID_ARGUMENTS",
+            message="--fields requires --output ndjson, columnar or columnar-framed.",
+            details={"output": args.output, "fields": args.fields},
+        )
+
+
+def stream_header(stream: RecordStream) -> dict[str, Any]:
+    return {
+        "type": "header",
+        "schema_version": SCHEMA_VERSION,
+        "command": stream.command,
+        "data": stream.header,
+    }
+
+
+def stream_trailer(stream: RecordStream, count: int) -> dict[str, Any]:
+    return {
+        "type": "trailer",
+        "schema_version": SCHEMA_VERSION,
+        "ok": True,
+        "data": {"count": count, **stream.summary},
+    }
+
+
+def stream_fields(stream: RecordStream, fields: list[str] | None) -> list[str] | None:
+    # Updates refer to records by id, so a projection has to keep it.
+    if fields and stream.updates is not None and "id" not in fields:
+        return ["id", *fields]
+    return fields
+
+
+def stream_messages(stream: RecordStream) -> Iterator[dict[str, Any]]:
+    yield stream_header(stream)
+    count = 0
+    for record in stream.records:
+        yield {"type": "record", "data": record}
+        count += 1
+    for update in stream.updates or ():
+        yield {"type": "update", "data": update}
+    yield stream_trailer(stream, count)
+
+
+def apply_updates(
+    records: list[dict[str, Any]], updates: Iterable[dict[str, Any]] | None
+) -> None:
+    by_id = {record["id"]: record for record in records if "id" in record}
+    for update in updates or ():
+        if update["id"] in by_id:
+            by_id[update["id"]].update(update)
+
+
+def columnar_document(stream: RecordStream, fields: list[str] | None) -> dict[str, Any]:
+    # Buffered anyway, so updates are applied to the rows instead of sent.
+    records = list(stream.records)
+    apply_updates(records, stream.updates)
+    table = ColumnTable(fields)
+    rows = [table.row(record)[0] for record in records]
+    # Fields only grow at the end, so earlier rows just need padding.
+    for row in rows:
+        row.extend([None] * (len(table.fields) - len(row)))
+    return ok(
+        {
+            **stream.header,
+            "count": len(rows),
+            **stream.summary,
+            "fields": table.fields,
+            "rows": rows,
+        }
+    )
+
+
+def framed_messages(stream: RecordStream, fields: list[str] | None) -> Iterator[Any]:
+    # Header and trailer are objects; each record is a bare array in field order.
+    # A {"type": "fields"} message announces columns first seen mid-stream, and
+    # {"type": "update"} messages follow the last row.
+    table = ColumnTable(stream_fields(stream, fields))
+    records = iter(stream.records)
+    first = next(records, None)
+    first_row = table.row(first)[0] if first is not None else None
+    yield {**stream_header(stream), "fields": list(table.fields)}
+    if first_row is None:
+        yield stream_trailer(stream, 0)
+        return
+    yield first_row
+    count = 1
+    for record in records:
+        row, grew = table.row(record)
+        if grew:
+            yield {"type": "fields", "fields": list(table.fields)}
+        yield row
+        count += 1
+    for update in stream.updates or ():
+        yield {
+            "type": "update",
+            "data": project_update(update, table.fields if table.fixed else None),
+        }
+    yield stream_trailer(stream, count)
+
+
+def emit_frame(value: Any) -> None:
+    sys.stdout.buffer.write(frame(value))
+    sys.stdout.buffer.flush()
+
+
+def emit_stream(
+    stream: RecordStream, output: str = "ndjson", fields: list[str] | None = None
+) -> None:
+    if output == "columnar":
+        sys.stdout.write(compact_json(columnar_document(stream, fields)) + "\n")
+    elif output == "columnar-framed":
+        for message in framed_messages(stream, fields):
+            emit_frame(message)
+    else:
+        for message in stream_messages(stream):
+            emit_line(message)
+
+
+def emit_failure(payload: dict[str, Any], output: str) -> None:
+    if output == "ndjson":
+        emit_line({"type": "trailer", **payload})
+    elif output == "columnar-framed":
+        emit_frame({"type": "trailer", **payload})
+    else:
+        emit(payload)
+
+
+def respond(
+    args: argparse.Namespace,
+    header: dict[str, Any],
+    key: str,
+    records: Iterable[dict[str, Any]],
+) -> dict[str, Any] | RecordStream:
+    if streams_records(args):
+        return RecordStream(command=args.command, header=header, records=records)
+    records = list(records)
+    return ok({**header, key: records, "count": len(records)})
+
+
 def require_safari_context(origin_title: str | None, origin_url: str | None) -> tuple[str, str]:
     if not origin_title or not origin_url:
         raise CtxError(
@@ -48,8 +252,8 @@ def require_safari_context(origin_title: str | None, origin_url: str | None) ->
     return origin_title, origin_url
 
 
-def cmd_capture(args: argparse.Namespace, db: Database) -> dict[str, Any]:
-    origin_title, origin_url = require_safari_context(args.origin_title, args.origin_url)
+def cmd_capture(args: argparse.Namespace, db: Database) -> dict[str, Any] | RecordStream:
+    require_safari_context(args.origin_title, args.origin_url)
 
     downloads_dir = Path(args.downloads_dir).expanduser().resolve()
     result = find_newest_stable_download(downloads_dir, args.within)
@@ -68,7 +272,9 @@ def cmd_capture(args: argparse.Namespace, db: Database) -> dict[str, Any]:
     assert target is not None
 
     try:
+        file_size_bytes = target.stat().st_size
         file_hash = sha256_file(target)
+        file_fingerprint = sampled_fingerprint(target, file_size_bytes)
     except OSError as exc:
         raise CtxError(
             code="HASH_ERROR",
@@ -76,20 +282,39 @@ def cmd_capture(args: argparse.Namespace, db: Database) -> dict[str, Any]:
             details={"path": str(target), "reason": str(exc)},
         ) from exc
 
+    record = record_capture(args, db, target, file_size_bytes, file_hash, file_fingerprint)
+    return capture_response(args, record)
+
+
+def record_capture(
+    args: argparse.Namespace,
+    db: Database,
+    target: Path,
+    file_size_bytes: int,
+    file_hash: str,
+    file_fingerprint: str,
+) -> dict[str, Any]:
     guessed_type, _ = mimetypes.guess_type(target.name)
-    record = db.insert_capture(
+    return db.insert_capture(
         file_hash=file_hash,
         file_name=target.name,
-        file_size_bytes=target.stat().st_size,
+        file_size_bytes=file_size_bytes,
         file_path_at_capture=str(target),
-        origin_title=origin_title,
-        origin_url=origin_url,
+        origin_title=args.origin_title,
+        origin_url=args.origin_url,
         note=args.note,
         browser="safari",
         source_app=args.source_app,
         mime_type=guessed_type,
+        file_fingerprint=file_fingerprint,
     )
 
+
+def capture_response(
+    args: argparse.Namespace, record: dict[str, Any]
+) -> dict[str, Any] | RecordStream:
+    if streams_records(args):
+        return RecordStream(command="capture", header={}, records=[record])
     return ok(
         {
             "capture": record,
@@ -97,7 +322,7 @@ def cmd_capture(args: argparse.Namespace, db: Database) -> dict[str, Any]:
     )
 
 
-def cmd_lookup(args: argparse.Namespace, db: Database) -> dict[str, Any]:
+def cmd_lookup(args: argparse.Namespace, db: Database) -> dict[str, Any] | RecordStream:
     path = Path(args.path).expanduser().resolve()
     if not path.exists() or not path.is_file():
         raise CtxError(
@@ -107,6 +332,14 @@ def cmd_lookup(args: argparse.Namespace, db: Database) -> dict[str, Any]:
         )
 
     try:
+        file_size_bytes = path.stat().st_size
+        file_fingerprint = sampled_fingerprint(path, file_size_bytes)
+        if not args.verify and not db.has_size_fingerprint_candidate(
+            file_size_bytes, file_fingerprint
+        ):
+            # No capture shares this size and fingerprint, so the full hash
+            # cannot match anything either.
+            return respond(args, {"file_hash": None, "verified": False}, "records", [])
         file_hash = sha256_file(path)
     except OSError as exc:
         raise CtxError(
@@ -115,83 +348,281 @@ def cmd_lookup(args: argparse.Namespace, db: Database) -> dict[str, Any]:
             details={"path": str(path), "reason": str(exc)},
         ) from exc
 
-    records = db.lookup_by_hash(file_hash, limit=args.limit)
-    if records:
+    if db.lookup_by_hash(file_hash, limit=1):
         # Keep lookup/search results aligned with the latest observed filename/path
         # when users rename or move the file after capture.
-        db.refresh_observed_file_location(file_hash, str(path))
-        records = db.lookup_by_hash(file_hash, limit=args.limit)
-    return ok(
-        {
-            "file_hash": file_hash,
-            "records": records,
-            "count": len(records),
-        }
+        db.refresh_observed_file_location(file_hash, str(path), file_fingerprint)
+    return respond(
+        args,
+        {"file_hash": file_hash, "verified": True},
+        "records",
+        db.iter_lookup_by_hash(file_hash, limit=args.limit),
     )
 
 
-def cmd_search(args: argparse.Namespace, db: Database) -> dict[str, Any]:
+@dataclass
+class ReconcileScan:
+    scan_roots: list[Path]
+    dir_priorities: dict[str, float]
+    hash_to_path: dict[str, str | None] = field(default_factory=dict)
+    relocated: dict[str, str] = field(default_factory=dict)
+    stats: ScanStats = field(default_factory=ScanStats)
+
+
+def start_reconcile(args: argparse.Namespace, db: Database) -> ReconcileScan:
+    return ReconcileScan(
+        scan_roots=resolve_scan_roots(args.scan_root),
+        dir_priorities=directory_priorities(db.relocation_hits()),
+    )
+
+
+def locate_relocated_path(
+    record: dict[str, Any],
+    args: argparse.Namespace,
+    scan: ReconcileScan,
+) -> str | None:
+    file_hash = record["file_hash"]
+    if file_hash not in scan.hash_to_path:
+        located = find_file_by_hash(
+            file_hash=file_hash,
+            file_size_bytes=record["file_size_bytes"],
+            scan_roots=scan.scan_roots,
+            max_seconds=args.reconcile_max_seconds,
+            max_candidates=args.reconcile_max_candidates,
+            file_fingerprint=record.get("file_fingerprint"),
+            dir_priorities=scan.dir_priorities,
+            stats=scan.stats,
+        )
+        scan.hash_to_path[file_hash] = str(located) if located else None
+
+    observed_path = scan.hash_to_path[file_hash]
+    if observed_path and observed_path != record["file_path_at_capture"]:
+        scan.relocated[file_hash] = observed_path
+        return observed_path
+    return None
+
+
+def persist_relocations(db: Database, scan: ReconcileScan) -> None:
+    for file_hash, observed_path in scan.relocated.items():
+        db.refresh_observed_file_location(file_hash, observed_path)
+        db.record_relocation_hit(str(Path(observed_path).parent))
+
+
+def is_stale(record: dict[str, Any]) -> bool:
+    return not Path(record["file_path_at_capture"]).expanduser().exists()
+
+
+def cmd_search(args: argparse.Namespace, db: Database) -> dict[str, Any] | RecordStream:
+    if streams_records(args):
+        return stream_search(args, db)
+
     records, backend = db.search_captures(args.q, limit=args.limit)
     reconciled = 0
+    reconcile_timeouts = 0
 
     if args.reconcile_paths and records:
-        scan_roots = resolve_scan_roots(args.scan_root)
-        stale = [
-            record
-            for record in records
-            if not Path(record["file_path_at_capture"]).expanduser().exists()
-        ]
-        hash_to_path: dict[str, str | None] = {}
-
-        for record in stale[: args.reconcile_max_records]:
-            file_hash = record["file_hash"]
-            observed_path = hash_to_path.get(file_hash)
-            if file_hash not in hash_to_path:
-                located = find_file_by_hash(
-                    file_hash=file_hash,
-                    file_size_bytes=record["file_size_bytes"],
-                    scan_roots=scan_roots,
-                    max_seconds=args.reconcile_max_seconds,
-                    max_candidates=args.reconcile_max_candidates,
-                )
-                observed_path = str(located) if located else None
-                hash_to_path[file_hash] = observed_path
-
-            if observed_path and observed_path != record["file_path_at_capture"]:
-                db.refresh_observed_file_location(file_hash, observed_path)
+        scan = start_reconcile(args, db)
+        to_scan, _ = group_stale_by_hash(
+            (record for record in records if is_stale(record)), args.reconcile_max_records
+        )
+        for record in to_scan:
+            if locate_relocated_path(record, args, scan):
                 reconciled += 1
+        reconcile_timeouts = scan.stats.timeouts
 
         if reconciled > 0:
+            persist_relocations(db, scan)
             records, backend = db.search_captures(args.q, limit=args.limit)
 
+    data: dict[str, Any] = {"query": args.q, "backend": backend}
+    if args.include_archive:
+        data["archive_backend"] = None
+        records.extend(iter_archive_search(db, args.q, args.limit - len(records), data))
     return ok(
         {
-            "query": args.q,
-            "backend": backend,
+            **data,
             "results": records,
             "count": len(records),
             "reconciled": reconciled,
+            "reconcile_timeouts": reconcile_timeouts,
         }
     )
 
 
+def stream_search(args: argparse.Namespace, db: Database) -> RecordStream:
+    records, backend = db.iter_search_captures(args.q, limit=args.limit)
+    stream = RecordStream(
+        command="search",
+        header={"query": args.q, "backend": backend},
+        records=records,
+        summary={"reconciled": 0, "reconcile_timeouts": 0},
+    )
+    if args.reconcile_paths:
+        # Rows go out as soon as they are read; the disk scans for stale ones
+        # only start once the read cursor is done, and report as updates.
+        stale: list[dict[str, Any]] = []
+        stream.records = _iter_collecting_stale(records, stale)
+        stream.updates = _iter_relocation_updates(stale, args, db, stream.summary)
+    if args.include_archive:
+        stream.summary["archive_backend"] = None
+        stream.records = _iter_with_archive(stream.records, args, db, stream.summary)
+    return stream
+
+
+def relocation_update(record: dict[str, Any], observed_path: str) -> dict[str, Any]:
+    return {
+        "id": record["id"],
+        "file_name": Path(observed_path).name,
+        "file_path_at_capture": observed_path,
+    }
+
+
+def group_stale_by_hash(
+    records: Iterable[dict[str, Any]], max_hashes: int
+) -> tuple[list[dict[str, Any]], dict[str, list[dict[str, Any]]]]:
+    # One scan per distinct hash, capped at max_hashes; every record with a
+    # located hash is updated, including ones past the cap.
+    by_hash: dict[str, list[dict[str, Any]]] = {}
+    for record in records:
+        by_hash.setdefault(record["file_hash"], []).append(record)
+    return [matches[0] for matches in list(by_hash.values())[:max_hashes]], by_hash
+
+
+def _iter_collecting_stale(
+    records: Iterator[dict[str, Any]], stale: list[dict[str, Any]]
+) -> Iterator[dict[str, Any]]:
+    for record in records:
+        if is_stale(record):
+            stale.append(record)
+        yield record
+
+
+def _iter_relocation_updates(
+    stale: list[dict[str, Any]],
+    args: argparse.Namespace,
+    db: Database,
+    summary: dict[str, Any],
+) -> Iterator[dict[str, Any]]:
+    if not stale:
+        return
+    scan = start_reconcile(args, db)
+    to_scan, by_hash = group_stale_by_hash(stale, args.reconcile_max_records)
+    for record in to_scan:
+        observed_path = locate_relocated_path(record, args, scan)
+        if not observed_path:
+            continue
+        for match in by_hash[record["file_hash"]]:
+            summary["reconciled"] += 1
+            yield relocation_update(match, observed_path)
+    summary["reconcile_timeouts"] = scan.stats.timeouts
+    persist_relocations(db, scan)
+
+
+def _iter_with_archive(
+    records: Iterator[dict[str, Any]],
+    args: argparse.Namespace,
+    db: Database,
+    summary: dict[str, Any],
+) -> Iterator[dict[str, Any]]:
+    count = 0
+    for record in records:
+        count += 1
+        yield record
+    # The archive only fills whatever the hot database left of the limit.
+    yield from iter_archive_search(db, args.q, args.limit - count, summary)
+
+
+def cmd_reconcile_stats(args: argparse.Namespace, db: Database) -> dict[str, Any] | RecordStream:
+    if args.reset:
+        return ok({"reset": db.reset_relocation_hits()})
+
+    now = int(time.time())
+    directories = [
+        {**hit, "score": round(decayed_score(hit["score"], hit["last_hit_at"], now), 4)}
+        for hit in db.relocation_hits()
+    ]
+    directories.sort(key=lambda hit: hit["score"], reverse=True)
+    return respond(args, {}, "directories", directories[: args.limit])
+
+
+def cmd_doctor(args: argparse.Namespace, db: Database) -> dict[str, Any]:
+    return ok(diagnose(db, args.repair))
+
+
+def cmd_stats(args: argparse.Namespace, db: Database) -> dict[str, Any]:
+    flush_spool(db)
+    return ok(summarize(db, args.window or DEFAULT_WINDOWS, command=args.for_command))
+
+
+def cmd_retain(args: argparse.Namespace, db: Database) -> dict[str, Any]:
+    policy = build_policy(
+        db,
+        older_than=args.older_than,
+        keep_latest=args.keep_latest,
+        missing_files=args.missing_files,
+        scan_roots=resolve_scan_roots(args.scan_root),
+        max_seconds=args.reconcile_max_seconds,
+        max_candidates=args.reconcile_max_candidates,
+    )
+    return ok(
+        retain(
+            db,
+            policy,
+            batch_size=args.batch_size,
+            max_rows=args.max_rows,
+            max_seconds=args.max_seconds,
+            dry_run=args.dry_run,
+        )
+    )
+
+
+def cmd_compact(args: argparse.Namespace, db: Database) -> dict[str, Any]:
+    return ok(
+        compact(
+            db,
+            vacuum_pages=args.vacuum_pages,
+            merge_pages=args.merge_pages,
+            max_seconds=args.max_seconds,
+            enable_incremental_vacuum=args.enable_incremental_vacuum,
+        )
+    )
+
+
+def cmd_migrate(args: argparse.Namespace, db: Database) -> dict[str, Any] | RecordStream:
+    # Schema steps already ran in prepare_database; this finishes the backfills.
+    chunks = 0 if args.status else db.run_backfills(max_seconds=args.max_seconds)
+    migrations = db.migration_status()
+    header = {
+        "chunks": chunks,
+        "pending_backfills": sum(1 for entry in migrations if entry["state"] == "backfilling"),
+    }
+    return respond(args, header, "migrations", migrations)
+
+
 def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(prog="ctx-core")
     sub = parser.add_subparsers(dest="command", required=True)
 
-    p_capture = sub.add_parser("capture")
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--output", choices=OUTPUT_FORMATS, default="json")
+    # Record projection for the streamed formats (ndjson, columnar, columnar-framed).
+    common.add_argument("--fields", type=parse_fields)
+
+    p_capture = sub.add_parser("capture", parents=[common])
     p_capture.add_argument("--downloads-dir", default="~/Downloads")
     p_capture.add_argument("--within", type=int, default=60)
     p_capture.add_argument("--origin-title")
     p_capture.add_argument("--origin-url")
     p_capture.add_argument("--note")
     p_capture.add_argument("--source-app")
+    p_capture.add_argument("--engine", choices=ENGINES, default="sync")
 
-    p_lookup = sub.add_parser("lookup")
+    p_lookup = sub.add_parser("lookup", parents=[common])
     p_lookup.add_argument("--path", required=True)
     p_lookup.add_argument("--limit", type=int, default=20)
+    p_lookup.add_argument("--verify", action="store_true")
 
-    p_search = sub.add_parser("search")
+    p_search = sub.add_parser("search", parents=[common])
     p_search.add_argument("--q", required=True)
     p_search.add_argument("--limit", type=int, default=20)
     p_search.add_argument(
@@ -203,40 +634,133 @@ def build_parser() -> argparse.ArgumentParser:
     p_search.add_argument("--reconcile-max-seconds", type=float, default=8.0)
     p_search.add_argument("--reconcile-max-candidates", type=int, default=2000)
     p_search.add_argument("--reconcile-max-records", type=int, default=10)
+    p_search.add_argument("--include-archive", action="store_true")
+    p_search.add_argument("--engine", choices=ENGINES, default="sync")
+
+    p_reconcile_stats = sub.add_parser("reconcile-stats", parents=[common])
+    p_reconcile_stats.add_argument("--limit", type=int, default=20)
+    p_reconcile_stats.add_argument("--reset", action="store_true")
+
+    p_doctor = sub.add_parser("doctor", parents=[common])
+    p_doctor.add_argument("--repair", action="append", choices=REPAIR_ACTIONS, default=[])
+
+    p_stats = sub.add_parser("stats", parents=[common])
+    p_stats.add_argument("--window", action="append", default=[])
+    p_stats.add_argument("--command", dest="for_command")
+
+    p_retain = sub.add_parser("retain", parents=[common])
+    p_retain.add_argument("--older-than")
+    p_retain.add_argument("--keep-latest", type=int)
+    p_retain.add_argument("--missing-files", action="store_true")
+    p_retain.add_argument("--scan-root", action="append", default=[])
+    p_retain.add_argument("--reconcile-max-seconds", type=float, default=2.0)
+    p_retain.add_argument("--reconcile-max-candidates", type=int, default=2000)
+    p_retain.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    p_retain.add_argument("--max-rows", type=int)
+    p_retain.add_argument("--max-seconds", type=float, default=DEFAULT_RETAIN_SECONDS)
+    p_retain.add_argument("--dry-run", action="store_true")
+
+    p_compact = sub.add_parser("compact", parents=[common])
+    p_compact.add_argument("--vacuum-pages", type=int, default=DEFAULT_VACUUM_PAGES)
+    p_compact.add_argument("--merge-pages", type=int, default=DEFAULT_MERGE_PAGES)
+    p_compact.add_argument("--max-seconds", type=float, default=DEFAULT_COMPACT_SECONDS)
+    p_compact.add_argument("--enable-incremental-vacuum", action="store_true")
+
+    p_migrate = sub.add_parser("migrate", parents=[common])
+    p_migrate.add_argument("--status", action="store_true")
+    p_migrate.add_argument("--max-seconds", type=float)
 
     return parser
 
 
+def prepare_database(db: Database, advance_backfills: bool = True) -> None:
+    db.prepare(advance_backfills=advance_backfills)
+
+
+def advances_backfills(args: argparse.Namespace) -> bool:
+    # `migrate --status` only reports progress; it must not make any.
+    return not (args.command == "migrate" and args.status)
+
+
+def dispatch(args: argparse.Namespace, db: Database) -> dict[str, Any] | RecordStream:
+    check_fields(args)
+    if args.command == "capture":
+        return cmd_capture(args, db)
+    if args.command == "lookup":
+        return cmd_lookup(args, db)
+    if args.command == "search":
+        return cmd_search(args, db)
+    if args.command == "reconcile-stats":
+        return cmd_reconcile_stats(args, db)
+    if args.command == "doctor":
+        return cmd_doctor(args, db)
+    if args.command == "stats":
+        return cmd_stats(args, db)
+    if args.command == "retain":
+        return cmd_retain(args, db)
+    if args.command == "compact":
+        return cmd_compact(args, db)
+    if args.command == "migrate":
+        return cmd_migrate(args, db)
+    raise CtxError(code="UNKNOWN_COMMAND", message=f"Unsupported command: {args.command}")
+
+
+def as_stream(args: argparse.Namespace, payload: dict[str, Any] | RecordStream) -> RecordStream:
+    if not isinstance(payload, RecordStream):
+        return RecordStream(command=args.command, header=payload["data"], records=[])
+    if args.fields and args.output == "ndjson":
+        # Columnar outputs project through their ColumnTable instead.
+        fields = stream_fields(payload, args.fields)
+        payload.records = project_records(payload.records, fields)
+        if payload.updates is not None:
+            payload.updates = (project_update(update, fields) for update in payload.updates)
+    return payload
+
+
+def failure_for(exc: Exception) -> tuple[int, dict[str, Any]]:
+    if isinstance(exc, CtxError):
+        return 1, fail(exc.code, exc.message, exc.details)
+    if is_busy_error(exc):
+        return 1, fail("DB_BUSY", "Database is busy.", {"reason": str(exc)})
+    # Defensive fallback for anything unexpected.
+    return 2, fail("DB_ERROR", "Unexpected failure.", {"reason": str(exc)})
+
+
+def emit_payload(
+    args: argparse.Namespace, payload: dict[str, Any] | RecordStream
+) -> dict[str, Any]:
+    # Returns the header/summary data that command metrics observe.
+    if streams_records(args):
+        stream = as_stream(args, payload)
+        emit_stream(stream, args.output, args.fields)
+        return {**stream.header, **stream.summary}
+    assert isinstance(payload, dict)
+    emit(payload)
+    return payload["data"]
+
+
 def run(argv: list[str] | None = None) -> int:
     parser = build_parser()
     args = parser.parse_args(argv)
+    if getattr(args, "engine", "sync") == "async":
+        # Imported only here: asyncio alone adds ~50 ms to every sync invocation.
+        from ctx_core.async_commands import run_async_command
+
+        return run_async_command(args)
 
     db = Database()
+    metrics = CommandMetrics(args.command)
     try:
-        db.configure()
-        db.run_migrations()
-        db.ensure_fts()
-
-        if args.command == "capture":
-            payload = cmd_capture(args, db)
-        elif args.command == "lookup":
-            payload = cmd_lookup(args, db)
-        elif args.command == "search":
-            payload = cmd_search(args, db)
-        else:
-            payload = fail("UNKNOWN_COMMAND", f"Unsupported command: {args.command}")
-            emit(payload)
-            return 2
-
-        emit(payload)
+        prepare_database(db, advance_backfills=advances_backfills(args))
+        metrics.observe(emit_payload(args, dispatch(args, db)))
         return 0
-    except CtxError as exc:
-        emit(fail(exc.code, exc.message, exc.details))
-        return 1
-    except Exception as exc:  # pragma: no cover - defensive fallback
-        emit(fail("DB_ERROR", "Unexpected failure.", {"reason": str(exc)}))
-        return 2
+    except Exception as exc:
+        rc, failure = failure_for(exc)
+        metrics.fail(failure)
+        emit_failure(failure, args.output)
+        return rc
     finally:
+        record_command(db, metrics)
         db.close()
 
 
@@ -0,0 +1,178 @@
+from __future__ import annotations
+
+import json
+import math
+import os
+import re
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from itertools import groupby
+from pathlib import Path
+from typing import Any
+
+from ctx_core.db import Database
+from ctx_core.encoding import compact_json
+from ctx_core.errors import CtxError
+from ctx_core.hashing import bytes_hashed
+from ctx_core.paths import resolve_metrics_spool_path
+
+MAX_METRIC_ROWS = 10_000
+DEFAULT_WINDOWS = ["24h", "7d"]
+PERCENTILES = (50, 95, 99)
+
+_WINDOW_PATTERN = re.compile(r"^(\d+)([smhd])$")
+_WINDOW_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+@dataclass
+class CommandMetrics:
+    command: str
+    started: float = field(default_factory=time.perf_counter)
+    hashed_at_start: int = field(default_factory=bytes_hashed)
+    outcome: str = "OK"
+    backend: str | None = None
+    reconciled: int = 0
+    reconcile_timeouts: int = 0
+
+    def observe(self, data: dict[str, Any]) -> None:
+        self.backend = data.get("backend", self.backend)
+        self.reconciled = data.get("reconciled", self.reconciled)
+        self.reconcile_timeouts = data.get("reconcile_timeouts", self.reconcile_timeouts)
+
+    def fail(self, failure: dict[str, Any]) -> None:
+        self.outcome = failure["error"]["code"]
+
+    def as_row(self) -> dict[str, Any]:
+        return {
+            "recorded_at": int(time.time()),
+            "command": self.command,
+            "backend": self.backend,
+            "outcome": self.outcome,
+            "duration_ms": round((time.perf_counter() - self.started) * 1000, 3),
+            "bytes_hashed": bytes_hashed() - self.hashed_at_start,
+            "reconciled": self.reconciled,
+            "reconcile_timeouts": self.reconcile_timeouts,
+        }
+
+
+def read_spool(path: Path) -> list[dict[str, Any]]:
+    rows: list[dict[str, Any]] = []
+    try:
+        with path.open(encoding="utf-8") as handle:
+            for line in handle:
+                try:
+                    rows.append(json.loads(line))
+                except ValueError:
+                    # A line cut short by a crash mid-append.
+                    continue
+    except FileNotFoundError:
+        pass
+    return rows
+
+
+def claim_spool(path: Path) -> list[dict[str, Any]]:
+    # Renaming first means two invocations never flush the same samples.
+    claimed = path.with_name(f"{path.name}.{os.getpid()}")
+    try:
+        os.replace(path, claimed)
+    except FileNotFoundError:
+        return []
+    try:
+        return read_spool(claimed)
+    finally:
+        claimed.unlink(missing_ok=True)
+
+
+def append_spool(path: Path, rows: list[dict[str, Any]]) -> None:
+    # One append-mode write per call, so concurrent invocations don't interleave.
+    try:
+        with path.open("a", encoding="utf-8") as handle:
+            handle.write("".join(f"{compact_json(row)}\n" for row in rows))
+    except OSError:
+        pass
+
+
+def flush_spool(db: Database) -> None:
+    # Folds spooled samples into command_metrics. A flush that can't get the
+    # lock in time puts the samples back for the next one.
+    spool = resolve_metrics_spool_path(db.db_path)
+    rows = claim_spool(spool)[-MAX_METRIC_ROWS:]
+    if not rows:
+        return
+    try:
+        db.record_metrics(rows, max_rows=MAX_METRIC_ROWS)
+    except Exception:
+        # Metrics are best effort; they must never turn a result into a failure.
+        append_spool(spool, rows)
+    finally:
+        db.has_written = False
+
+
+def record_command(db: Database, metrics: CommandMetrics) -> None:
+    # Samples go to the spool without touching the database, so read-only
+    # commands never open a write transaction just to be counted. Commands
+    # that already wrote fold the spool while they're at it; `stats` folds it
+    # before reporting.
+    append_spool(resolve_metrics_spool_path(db.db_path), [metrics.as_row()])
+    if db.has_written:
+        flush_spool(db)
+
+
+def parse_window(window: str) -> int | None:
+    if window == "all":
+        return None
+    match = _WINDOW_PATTERN.match(window)
+    if not match:
+        raise CtxError(
+            code="INVALID_WINDOW",
+            message="Window must look like 90m, 24h, 7d or 'all'.",
+            details={"window": window},
+        )
+    return int(match.group(1)) * _WINDOW_UNITS[match.group(2)]
+
+
+def percentile(ordered: list[float], pct: int) -> float:
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize_group(rows: list[dict[str, Any]]) -> dict[str, Any]:
+    durations = [row["duration_ms"] for row in rows]
+    outcomes = Counter(row["outcome"] for row in rows)
+    summary: dict[str, Any] = {
+        "command": rows[0]["command"],
+        "backend": rows[0]["backend"],
+        "count": len(rows),
+        "errors": len(rows) - outcomes.get("OK", 0),
+        "outcomes": dict(outcomes),
+    }
+    for pct in PERCENTILES:
+        summary[f"p{pct}_ms"] = percentile(durations, pct)
+    summary["max_ms"] = durations[-1]
+    summary["bytes_hashed"] = sum(row["bytes_hashed"] for row in rows)
+    summary["reconciled"] = sum(row["reconciled"] for row in rows)
+    summary["reconcile_timeouts"] = sum(row["reconcile_timeouts"] for row in rows)
+    return summary
+
+
+def summarize(db: Database, windows: list[str], command: str | None = None) -> dict[str, Any]:
+    now = int(time.time())
+    reports: list[dict[str, Any]] = []
+    for window in windows:
+        seconds = parse_window(window)
+        since = None if seconds is None else now - seconds
+        # Rows arrive sorted by (command, backend, duration), so each group's
+        # durations are already ordered for the percentile lookup.
+        groups = [
+            summarize_group(list(rows))
+            for _, rows in groupby(
+                db.iter_metrics(since=since, command=command),
+                key=lambda row: (row["command"], row["backend"]),
+            )
+        ]
+        reports.append({"window": window, "groups": groups})
+    return {
+        "windows": reports,
+        "pending_samples": len(read_spool(resolve_metrics_spool_path(db.db_path))),
+    }
@@ -14,5 +14,16 @@ def resolve_db_path() -> Path:
     return DEFAULT_DB_PATH
 
 
+def resolve_archive_db_path(db_path: Path) -> Path:
+    env_path = os.environ.get("CTX_ARCHIVE_DB_PATH", "").strip()
+    if env_path:
+        return Path(env_path).expanduser().resolve()
+    return db_path.with_name(f"{db_path.stem}-archive{db_path.suffix}")
+
+
+def resolve_metrics_spool_path(db_path: Path) -> Path:
+    return db_path.with_name(f"{db_path.stem}-metrics.ndjson")
+
+
 def ensure_parent_dir(path: Path) -> None:
     path.parent.mkdir(parents=True, exist_ok=True)
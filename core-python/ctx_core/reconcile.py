@@ -1,10 +1,15 @@
 from __future__ import annotations
 
+import heapq
+import itertools
 import os
 import time
+from collections.abc import Iterable
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Any
 
-from ctx_core.hashing import sha256_file
+from ctx_core.hashing import sampled_fingerprint, sha256_file
 
 DEFAULT_SCAN_ROOTS = [
     "~/Downloads",
@@ -22,6 +27,34 @@ SKIP_DIR_NAMES = {
     ".venv",
 }
 
+# Learned directory scores halve after this long without a new relocation hit.
+HIT_HALF_LIFE_SECONDS = 30 * 24 * 3600
+
+
+@dataclass
+class ScanStats:
+    scans: int = 0
+    timeouts: int = 0
+
+
+def decayed_score(score: float, last_hit_at: int, now: int) -> float:
+    age = max(0, now - last_hit_at)
+    return score * 0.5 ** (age / HIT_HALF_LIFE_SECONDS)
+
+
+def directory_priorities(hits: Iterable[dict[str, Any]], now: int | None = None) -> dict[str, float]:
+    # Every ancestor of a hit directory inherits its score, so the best-first
+    # walk descends from a scan root straight toward the hot subtrees.
+    now = int(time.time()) if now is None else now
+    priorities: dict[str, float] = {}
+    for hit in hits:
+        weight = decayed_score(hit["score"], hit["last_hit_at"], now)
+        path = Path(hit["dir_path"])
+        for directory in (path, *path.parents):
+            key = str(directory)
+            priorities[key] = priorities.get(key, 0.0) + weight
+    return priorities
+
 
 def resolve_scan_roots(cli_roots: list[str] | None = None) -> list[Path]:
     roots: list[str] = []
@@ -60,47 +93,91 @@ def find_file_by_hash(
     scan_roots: list[Path],
     max_seconds: float = 3.0,
     max_candidates: int = 2000,
+    file_fingerprint: str | None = None,
+    dir_priorities: dict[str, float] | None = None,
+    stats: ScanStats | None = None,
 ) -> Path | None:
     if file_size_bytes < 0:
         return None
 
+    stats = stats or ScanStats()
+    stats.scans += 1
     deadline = time.monotonic() + max_seconds
     hashed_candidates = 0
+    priorities = dir_priorities or {}
+
+    # Best-first over directories: learned priority, then scan-root order, then
+    # deepest first, so unlearned subtrees are still walked depth-first and the
+    # queue grows with tree depth rather than with the width of e.g. ~.
+    # Overlapping roots (e.g. ~/Downloads and ~) are visited once.
+    queue: list[tuple[float, int, int, int, str]] = []
+    sequence = itertools.count()
+    visited: set[str] = set()
+
+    def push(dirpath: str, root_rank: int, depth: int) -> None:
+        priority = -priorities.get(dirpath, 0.0)
+        heapq.heappush(queue, (priority, root_rank, -depth, next(sequence), dirpath))
+
+    for root_rank, root in enumerate(scan_roots):
+        push(str(root), root_rank, 0)
+
+    while queue:
+        if time.monotonic() > deadline:
+            stats.timeouts += 1
+            return None
+
+        _, root_rank, negative_depth, _, dirpath = heapq.heappop(queue)
+        depth = -negative_depth
+        if dirpath in visited:
+            continue
+        visited.add(dirpath)
 
-    for root in scan_roots:
-        for dirpath, dirnames, filenames in os.walk(root):
-            if time.monotonic() > deadline:
-                return None
-
-            dirnames[:] = [
-                d for d in dirnames if d not in SKIP_DIR_NAMES and not d.startswith(".")
-            ]
-
-            for filename in filenames:
-                if time.monotonic() > deadline or hashed_candidates >= max_candidates:
-                    return None
+        try:
+            entries = list(os.scandir(dirpath))
+        except OSError:
+            continue
 
-                candidate = Path(dirpath) / filename
-                try:
-                    stat = candidate.stat()
-                except OSError:
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name not in SKIP_DIR_NAMES and not entry.name.startswith("."):
+                        push(entry.path, root_rank, depth + 1)
                     continue
+            except OSError:
+                continue
 
-                if not candidate.is_file():
+            if time.monotonic() > deadline:
+                stats.timeouts += 1
+                return None
+            if hashed_candidates >= max_candidates:
+                return None
+
+            candidate = Path(entry.path)
+            try:
+                if not entry.is_file():
                     continue
-                if stat.st_size != file_size_bytes:
+                stat = entry.stat()
+            except OSError:
+                continue
+
+            if stat.st_size != file_size_bytes:
+                continue
+
+            hashed_candidates += 1
+            try:
+                if (
+                    file_fingerprint is not None
+                    and sampled_fingerprint(candidate, stat.st_size) != file_fingerprint
+                ):
                     continue
+                candidate_hash = sha256_file(candidate)
+            except OSError:
+                continue
 
-                hashed_candidates += 1
+            if candidate_hash == file_hash:
                 try:
-                    candidate_hash = sha256_file(candidate)
+                    return candidate.resolve()
                 except OSError:
-                    continue
-
-                if candidate_hash == file_hash:
-                    try:
-                        return candidate.resolve()
-                    except OSError:
-                        return candidate
+                    return candidate
 
     return None
@@ -0,0 +1,291 @@
+from __future__ import annotations
+
+import time
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+from ctx_core.db import Database
+from ctx_core.errors import CtxError
+from ctx_core.metrics import parse_window
+from ctx_core.paths import resolve_archive_db_path
+from ctx_core.reconcile import ScanStats, find_file_by_hash
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_VACUUM_PAGES = 256
+DEFAULT_MERGE_PAGES = 64
+DEFAULT_COMPACT_SECONDS = 5.0
+DEFAULT_RETAIN_SECONDS = 30.0
+
+# Sorts before every real (created_at, id) key.
+FIRST_KEY = (-1, "")
+
+
+def open_archive(db: Database) -> Database:
+    archive = Database(resolve_archive_db_path(db.db_path))
+    try:
+        archive.prepare()
+    except Exception:
+        archive.close()
+        raise
+    return archive
+
+
+def open_archive_for_search(db: Database) -> Database | None:
+    # Search only reads the archive; migrating it is left to retain.
+    path = resolve_archive_db_path(db.db_path)
+    if not path.exists():
+        return None
+    archive = Database(path)
+    try:
+        if archive.is_prepared():
+            return archive
+    except Exception:
+        archive.close()
+        raise
+    archive.close()
+    return None
+
+
+@dataclass
+class RetentionPolicy:
+    # Each boundary selects rows whose (created_at, id) key sorts before it.
+    boundaries: dict[str, tuple[int, str]] = field(default_factory=dict)
+    missing_files: bool = False
+    scan_roots: list[Path] = field(default_factory=list)
+    max_seconds: float = 2.0
+    max_candidates: int = 2000
+    located: dict[str, str | None] = field(default_factory=dict)
+    # Shared by the whole run; set by retain().
+    deadline: float | None = None
+
+    def last_key(self) -> tuple[int, str] | None:
+        # Without the missing-files policy nothing past this key can be selected.
+        if self.missing_files or not self.boundaries:
+            return None
+        return max(self.boundaries.values())
+
+    def expired(self) -> bool:
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def scan_seconds(self) -> float:
+        if self.deadline is None:
+            return self.max_seconds
+        return max(0.0, min(self.max_seconds, self.deadline - time.monotonic()))
+
+    def is_missing(self, record: dict[str, Any]) -> bool:
+        if Path(record["file_path_at_capture"]).expanduser().exists():
+            return False
+        file_hash = record["file_hash"]
+        if file_hash not in self.located:
+            stats = ScanStats()
+            located = find_file_by_hash(
+                file_hash=file_hash,
+                file_size_bytes=record["file_size_bytes"],
+                scan_roots=self.scan_roots,
+                max_seconds=self.scan_seconds(),
+                max_candidates=self.max_candidates,
+                file_fingerprint=record.get("file_fingerprint"),
+                stats=stats,
+            )
+            if located is None and stats.timeouts:
+                # Not found in time is not the same as gone; keep the row.
+                return False
+            self.located[file_hash] = str(located) if located else None
+        return self.located[file_hash] is None
+
+    def reason(self, record: dict[str, Any]) -> str | None:
+        key = (record["created_at"], record["id"])
+        for name, boundary in self.boundaries.items():
+            if key < boundary:
+                return name
+        if self.missing_files and self.is_missing(record):
+            return "missing_files"
+        return None
+
+
+def build_policy(
+    db: Database,
+    *,
+    older_than: str | None,
+    keep_latest: int | None,
+    missing_files: bool,
+    scan_roots: list[Path],
+    max_seconds: float,
+    max_candidates: int,
+) -> RetentionPolicy:
+    if older_than is None and keep_latest is None and not missing_files:
+        raise CtxError(
+            code="RETENTION_POLICY_MISSING",
+            message="Pass at least one of --older-than, --keep-latest or --missing-files.",
+        )
+    policy = RetentionPolicy(
+        missing_files=missing_files,
+        scan_roots=scan_roots,
+        max_seconds=max_seconds,
+        max_candidates=max_candidates,
+    )
+    if older_than is not None:
+        seconds = parse_window(older_than)
+        if seconds is None:
+            raise CtxError(
+                code="INVALID_WINDOW",
+                message="--older-than needs a bounded age such as 180d.",
+                details={"window": older_than},
+            )
+        policy.boundaries["older_than"] = (int(time.time()) - seconds, "")
+    if keep_latest is not None:
+        if keep_latest < 0:
+            raise CtxError(
+                code="INVALID_ARGUMENTS",
+                message="--keep-latest must not be negative.",
+                details={"keep_latest": keep_latest},
+            )
+        if keep_latest == 0:
+            boundary: tuple[int, str] | None = (2**63 - 1, "")
+        else:
+            boundary = db.keep_latest_boundary(keep_latest)
+        policy.boundaries["keep_latest"] = boundary or FIRST_KEY
+    return policy
+
+
+def retain(
+    db: Database,
+    policy: RetentionPolicy,
+    *,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    max_rows: int | None = None,
+    max_seconds: float | None = DEFAULT_RETAIN_SECONDS,
+    dry_run: bool = False,
+) -> dict[str, Any]:
+    archive = None if dry_run else open_archive(db)
+    by_policy = {name: 0 for name in policy.boundaries}
+    if policy.missing_files:
+        by_policy["missing_files"] = 0
+    result: dict[str, Any] = {
+        "dry_run": dry_run,
+        "archive_path": str(resolve_archive_db_path(db.db_path)),
+        "scanned": 0,
+        "selected": 0,
+        "archived": 0,
+        "deleted": 0,
+        "relocated": 0,
+        "batches": 0,
+        "timed_out": False,
+    }
+    # max_rows and max_seconds bound every row checked, kept ones included, so
+    # a run over files that all still exist stops as surely as one that moves rows.
+    if max_seconds is not None:
+        policy.deadline = time.monotonic() + max_seconds
+    after = FIRST_KEY
+    last_key = policy.last_key()
+    try:
+        while max_rows is None or result["scanned"] < max_rows:
+            limit = batch_size
+            if max_rows is not None:
+                limit = min(limit, max_rows - result["scanned"])
+            page = db.captures_page(after, limit)
+            if not page:
+                break
+
+            selected: list[dict[str, Any]] = []
+            for record in page:
+                if policy.expired():
+                    result["timed_out"] = True
+                    break
+                after = (record["created_at"], record["id"])
+                result["scanned"] += 1
+                reason = policy.reason(record)
+                if reason is None:
+                    continue
+                by_policy[reason] += 1
+                selected.append(record)
+            result["selected"] += len(selected)
+
+            if archive is not None and selected:
+                # Commit to the archive first; a crash before the delete leaves a
+                # duplicate that the next run's INSERT OR IGNORE skips.
+                result["archived"] += archive.archive_captures(selected)
+                result["deleted"] += db.delete_captures([record["id"] for record in selected])
+                result["batches"] += 1
+
+            if result["timed_out"] or (last_key is not None and after >= last_key):
+                break
+    finally:
+        if archive is not None:
+            archive.close()
+
+    if policy.missing_files:
+        for record_hash, located in policy.located.items():
+            if located is None:
+                continue
+            result["relocated"] += 1
+            if not dry_run:
+                db.refresh_observed_file_location(record_hash, located)
+    result["by_policy"] = by_policy
+    return result
+
+
+def iter_archive_search(
+    db: Database, query: str, limit: int, summary: dict[str, Any]
+) -> Iterator[dict[str, Any]]:
+    if limit <= 0:
+        return
+    archive = open_archive_for_search(db)
+    if archive is None:
+        # Missing, or not yet migrated to this version's schema.
+        summary["archive_backend"] = "unavailable"
+        return
+    try:
+        records, backend = archive.iter_search_captures(query, limit=limit)
+        summary["archive_backend"] = backend
+        for record in records:
+            yield {**record, "archived": True}
+    finally:
+        archive.close()
+
+
+def compact(
+    db: Database,
+    *,
+    vacuum_pages: int = DEFAULT_VACUUM_PAGES,
+    merge_pages: int = DEFAULT_MERGE_PAGES,
+    max_seconds: float = DEFAULT_COMPACT_SECONDS,
+    enable_incremental_vacuum: bool = False,
+) -> dict[str, Any]:
+    result: dict[str, Any] = {
+        "enabled_incremental_vacuum": (
+            db.enable_incremental_vacuum() if enable_incremental_vacuum else False
+        ),
+        "steps": 0,
+        "freed_pages": 0,
+        "fts_merges": 0,
+        "timed_out": False,
+    }
+    incremental = db.conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+    result["incremental_vacuum"] = incremental
+
+    # Each step is its own short write transaction, so other writers only ever
+    # wait for one step rather than the whole compaction.
+    deadline = time.monotonic() + max_seconds
+    while True:
+        if time.monotonic() >= deadline:
+            result["timed_out"] = True
+            break
+        progressed = False
+        if incremental and db.conn.execute("PRAGMA freelist_count").fetchone()[0] > 0:
+            freed = db.incremental_vacuum(vacuum_pages)
+            result["freed_pages"] += freed
+            progressed = freed > 0
+        if db.fts_available and db.fts_merge(merge_pages):
+            result["fts_merges"] += 1
+            progressed = True
+        if not progressed:
+            break
+        result["steps"] += 1
+
+    if result["freed_pages"]:
+        # Freed pages leave the file only once the WAL is checkpointed.
+        result["checkpoint"] = db.checkpoint_wal()
+    return result
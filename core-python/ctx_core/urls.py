@@ -0,0 +1,13 @@
+from __future__ import annotations
+
+from urllib.parse import urlsplit
+
+
+def normalize_host(url: str) -> str | None:
+    try:
+        host = urlsplit(url).hostname
+    except ValueError:
+        return None
+    if not host:
+        return None
+    return host.removeprefix("www.")
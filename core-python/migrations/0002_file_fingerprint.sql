@@ -0,0 +1,4 @@
+ALTER TABLE captures ADD COLUMN file_fingerprint TEXT;
+
+CREATE INDEX IF NOT EXISTS idx_captures_size_fingerprint
+  ON captures(file_size_bytes, file_fingerprint);
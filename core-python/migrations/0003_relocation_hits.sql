@@ -0,0 +1,8 @@
+CREATE TABLE IF NOT EXISTS relocation_hits (
+  dir_path TEXT PRIMARY KEY,
+  hits INTEGER NOT NULL,
+  score REAL NOT NULL,
+  last_hit_at INTEGER NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_relocation_hits_last_hit_at ON relocation_hits(last_hit_at);
@@ -0,0 +1,13 @@
+CREATE TABLE IF NOT EXISTS command_metrics (
+  id INTEGER PRIMARY KEY,
+  recorded_at INTEGER NOT NULL,
+  command TEXT NOT NULL,
+  backend TEXT,
+  outcome TEXT NOT NULL,
+  duration_ms REAL NOT NULL,
+  bytes_hashed INTEGER NOT NULL DEFAULT 0,
+  reconciled INTEGER NOT NULL DEFAULT 0,
+  reconcile_timeouts INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE INDEX IF NOT EXISTS idx_command_metrics_recorded_at ON command_metrics(recorded_at);
@@ -0,0 +1,3 @@
+-- captures_fts rowids now mirror captures rowids so FTS rows can be updated and
+-- deleted by rowid; ensure_fts rebuilds the table after this migration.
+DROP TABLE IF EXISTS captures_fts;
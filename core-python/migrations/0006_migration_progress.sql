@@ -0,0 +1,6 @@
+-- Python migrations backfill existing rows in chunks after their schema step;
+-- state moves from 'backfilling' to 'done' and cursor records the last chunk.
+ALTER TABLE schema_migrations ADD COLUMN state TEXT NOT NULL DEFAULT 'done';
+ALTER TABLE schema_migrations ADD COLUMN cursor TEXT;
+ALTER TABLE schema_migrations ADD COLUMN rows_done INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE schema_migrations ADD COLUMN updated_at INTEGER;
@@ -0,0 +1,30 @@
+from __future__ import annotations
+
+import sqlite3
+
+from ctx_core.urls import normalize_host
+
+# Adding a nullable column is a metadata-only change; existing rows are filled
+# in by backfill() one chunk at a time.
+SCHEMA = "ALTER TABLE captures ADD COLUMN origin_host TEXT;"
+
+
+def backfill(conn: sqlite3.Connection, cursor: str | None, limit: int) -> tuple[str | None, int]:
+    # Keyed on the primary key rather than rowid, which VACUUM may renumber.
+    rows = conn.execute(
+        "SELECT id, origin_url FROM captures WHERE id > ? ORDER BY id LIMIT ?",
+        (cursor or "", limit),
+    ).fetchall()
+    if not rows:
+        return None, 0
+    conn.executemany(
+        "UPDATE captures SET origin_host = ? WHERE id = ?",
+        [(normalize_host(row["origin_url"]), row["id"]) for row in rows],
+    )
+    return rows[-1]["id"], len(rows)
+
+
+def remaining(conn: sqlite3.Connection, cursor: str | None) -> int:
+    return conn.execute(
+        "SELECT count(*) FROM captures WHERE id > ?", (cursor or "",)
+    ).fetchone()[0]
@@ -0,0 +1,6 @@
+-- Small key/value store for internal markers. 'fts_synced' records that
+-- captures_fts matches captures; it is cleared whenever that may stop holding.
+CREATE TABLE IF NOT EXISTS ctx_meta (
+  key TEXT PRIMARY KEY,
+  value TEXT
+);
@@ -0,0 +1,5 @@
+-- Lookups read the newest captures of a hash; with created_at in the index
+-- they come back in order without a temp b-tree sort.
+CREATE INDEX IF NOT EXISTS idx_captures_file_hash_created_at
+  ON captures(file_hash, created_at);
+DROP INDEX IF EXISTS idx_captures_file_hash;
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""Stress ctx-core with parallel capture/lookup/search processes on one database."""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+CORE_PYTHON = ROOT / "core-python"
+OPERATIONS = ("capture", "lookup", "search")
+
+
+def core_env(db_path: Path) -> dict[str, str]:
+    env = os.environ.copy()
+    existing = env.get("PYTHONPATH", "")
+    env["PYTHONPATH"] = str(CORE_PYTHON) + (os.pathsep + existing if existing else "")
+    env["CTX_DB_PATH"] = str(db_path)
+    return env
+
+
+def invoke(arguments: list[str], env: dict[str, str]) -> tuple[float, str]:
+    started = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-m", "ctx_core", *arguments],
+        capture_output=True,
+        text=True,
+        env=env,
+        check=False,
+    )
+    elapsed = time.perf_counter() - started
+    try:
+        payload = json.loads(proc.stdout)
+    except json.JSONDecodeError:
+        return elapsed, "INVALID_OUTPUT"
+    if payload.get("ok"):
+        return elapsed, "OK"
+    return elapsed, payload.get("error", {}).get("code", "UNKNOWN_ERROR")
+
+
+def write_download(directory: Path, name: str, content: str) -> Path:
+    path = directory / name
+    path.write_text(content, encoding="utf-8")
+    # Backdate so the capture quiet-period check passes immediately.
+    past = time.time() - 5
+    os.utime(path, (past, past))
+    return path
+
+
+def capture_args(downloads_dir: Path) -> list[str]:
+    return [
+        "capture",
+        "--downloads-dir",
+        str(downloads_dir),
+        "--origin-title",
+        "Bench page",
+        "--origin-url",
+        "https://example.com/bench",
+        "--source-app",
+        "bench",
+    ]
+
+
+def worker(
+    index: int,
+    operation: str,
+    deadline: float,
+    workdir: Path,
+    env: dict[str, str],
+    lookup_path: Path,
+    results: dict[str, list[tuple[float, str]]],
+    lock: threading.Lock,
+) -> None:
+    downloads_dir = workdir / f"worker-{index}"
+    downloads_dir.mkdir()
+    iteration = 0
+    while time.monotonic() < deadline:
+        iteration += 1
+        if operation == "capture":
+            write_download(downloads_dir, f"file-{iteration}.txt", f"worker {index} file {iteration}")
+            outcome = invoke(capture_args(downloads_dir), env)
+        elif operation == "lookup":
+            outcome = invoke(["lookup", "--path", str(lookup_path)], env)
+        else:
+            outcome = invoke(["search", "--q", "bench", "--no-reconcile-paths"], env)
+        with lock:
+            results[operation].append(outcome)
+
+
+def percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, default=6)
+    parser.add_argument("--duration", type=float, default=20.0)
+    args = parser.parse_args(argv)
+
+    workdir = Path(tempfile.mkdtemp(prefix="ctx-bench-"))
+    db_path = workdir / "ctx.sqlite"
+    env = core_env(db_path)
+    try:
+        seed_dir = workdir / "seed"
+        seed_dir.mkdir()
+        lookup_path = write_download(seed_dir, "seed.txt", "bench seed")
+        _, code = invoke(capture_args(seed_dir), env)
+        if code != "OK":
+            print(f"Seed capture failed: {code}", file=sys.stderr)
+            return 1
+
+        results: dict[str, list[tuple[float, str]]] = defaultdict(list)
+        lock = threading.Lock()
+        started = time.monotonic()
+        deadline = started + args.duration
+        threads = [
+            threading.Thread(
+                target=worker,
+                args=(
+                    index,
+                    OPERATIONS[index % len(OPERATIONS)],
+                    deadline,
+                    workdir,
+                    env,
+                    lookup_path,
+                    results,
+                    lock,
+                ),
+            )
+            for index in range(args.workers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.monotonic() - started
+
+        total = 0
+        failed = 0
+        print(f"workers={args.workers} wall={wall:.1f}s db={db_path}")
+        for operation in OPERATIONS:
+            outcomes = results.get(operation, [])
+            if not outcomes:
+                continue
+            latencies = [elapsed for elapsed, _ in outcomes]
+            codes = Counter(code for _, code in outcomes)
+            failures = len(outcomes) - codes.get("OK", 0)
+            total += len(outcomes)
+            failed += failures
+            print(
+                f"{operation:8s} n={len(outcomes):4d} "
+                f"ops/s={len(outcomes) / wall:6.2f} "
+                f"p50={statistics.median(latencies) * 1000:7.1f}ms "
+                f"p95={percentile(latencies, 95) * 1000:7.1f}ms "
+                f"fail={failures / len(outcomes):6.1%} "
+                f"codes={dict(codes)}"
+            )
+        if total:
+            print(f"total    n={total:4d} ops/s={total / wall:6.2f} fail={failed / total:6.1%}")
+        return 0 if failed == 0 else 1
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -3,16 +3,29 @@ from __future__ import annotations
 import json
 import os
 import shutil
+import sqlite3
 import subprocess
+import sys
 import tempfile
 import time
 import unittest
 from pathlib import Path
 
+REPO = Path(__file__).resolve().parent.parent
+# Most checks run the CLI in a subprocess; these helpers are for the few that
+# need to reach inside a single invocation.
+sys.path.insert(0, str(REPO / "core-python"))
+
+from ctx_core.api import CtxCore, command_args
+from ctx_core.db import Database
+from ctx_core.encoding import iter_frames
+from ctx_core.hashing import sha256_file
+from ctx_core.reconcile import directory_priorities, find_file_by_hash
+
 
 class CtxCoreTests(unittest.TestCase):
     def setUp(self) -> None:
-        self.repo = Path(__file__).resolve().parent.parent
+        self.repo = REPO
         self.env = os.environ.copy()
         self.env["PYTHONPATH"] = str(self.repo / "core-python")
         self.tmp_db = tempfile.NamedTemporaryFile(prefix="ctx-test-", suffix=".sqlite", delete=False)
@@ -25,6 +38,8 @@ class CtxCoreTests(unittest.TestCase):
 
     def tearDown(self) -> None:
         Path(self.tmp_db.name).unlink(missing_ok=True)
+        Path(self.tmp_db.name.replace(".sqlite", "-archive.sqlite")).unlink(missing_ok=True)
+        Path(self.tmp_db.name.replace(".sqlite", "-metrics.ndjson")).unlink(missing_ok=True)
         shutil.rmtree(self.tmp_dir, ignore_errors=True)
 
     def run_core(self, *args: str) -> tuple[int, dict]:
@@ -147,6 +162,506 @@ class CtxCoreTests(unittest.TestCase):
             str(moved_path.resolve()),
         )
 
+    def test_learned_directory_priorities_find_deep_file_within_small_budget(self) -> None:
+        # Same-size decoys under the first scan root use up a small budget
+        # before an unlearned walk ever reaches the second root.
+        downloads = self.tmp_dir / "downloads"
+        for index in range(10):
+            decoy_dir = downloads / f"folder-{index}"
+            decoy_dir.mkdir(parents=True)
+            (decoy_dir / "decoy.txt").write_text(f"decoy{index}", encoding="utf-8")
+        hot_dir = self.tmp_dir / "documents" / "a" / "b" / "c"
+        hot_dir.mkdir(parents=True)
+        target = hot_dir / "target.txt"
+        target.write_text("target", encoding="utf-8")
+        budget = {
+            "file_hash": sha256_file(target),
+            "file_size_bytes": target.stat().st_size,
+            "scan_roots": [downloads.resolve(), (self.tmp_dir / "documents").resolve()],
+            "max_candidates": 3,
+        }
+
+        self.assertIsNone(find_file_by_hash(**budget))
+
+        with CtxCore(Path(self.tmp_db.name)) as core:
+            core.db.record_relocation_hit(str(hot_dir.resolve()))
+            rc, payload = core.execute(["reconcile-stats"])
+            self.assertEqual(rc, 0)
+            directories = payload["data"]["directories"]
+            self.assertEqual([d["dir_path"] for d in directories], [str(hot_dir.resolve())])
+            self.assertEqual(directories[0]["hits"], 1)
+
+            # Raw rows: reconcile-stats scores are already decayed.
+            priorities = directory_priorities(core.db.relocation_hits())
+            located = find_file_by_hash(**budget, dir_priorities=priorities)
+            self.assertEqual(located, target.resolve())
+
+            rc, payload = core.execute(["reconcile-stats", "--reset"])
+            self.assertEqual(payload["data"]["reset"], 1)
+
+    def test_search_ndjson_streams_header_records_trailer(self) -> None:
+        time.sleep(2.2)
+        rc, payload = self.run_core(
+            "capture",
+            "--downloads-dir",
+            str(self.tmp_dir),
+            "--within",
+            "60",
+            "--origin-title",
+            "Stream Test",
+            "--origin-url",
+            "https://example.com/stream",
+            "--source-app",
+            "test",
+        )
+        self.assertEqual(rc, 0)
+        self.assertTrue(payload["ok"])
+
+        proc = subprocess.run(
+            ["python3", "-m", "ctx_core", "search", "--q", "stream", "--output", "ndjson"],
+            capture_output=True,
+            text=True,
+            cwd=self.repo,
+            env=self.env,
+            check=False,
+        )
+        self.assertEqual(proc.returncode, 0)
+        lines = [json.loads(line) for line in proc.stdout.splitlines()]
+        self.assertEqual([line["type"] for line in lines], ["header", "record", "trailer"])
+        self.assertEqual(lines[0]["data"]["query"], "stream")
+        self.assertEqual(lines[1]["data"]["origin_title"], "Stream Test")
+        self.assertTrue(lines[2]["ok"])
+        self.assertEqual(lines[2]["data"]["count"], 1)
+
+    def test_search_ndjson_sends_relocations_after_the_records(self) -> None:
+        time.sleep(2.2)
+        for _ in range(2):
+            rc, _ = self.run_core(
+                "capture",
+                "--downloads-dir",
+                str(self.tmp_dir),
+                "--origin-title",
+                "Relocated stream",
+                "--origin-url",
+                "https://example.com/relocated",
+            )
+            self.assertEqual(rc, 0)
+        moved_dir = self.tmp_dir / "later"
+        moved_dir.mkdir()
+        moved = moved_dir / "moved.txt"
+        self.sample.rename(moved)
+
+        proc = subprocess.run(
+            [
+                "python3",
+                "-m",
+                "ctx_core",
+                "search",
+                "--q",
+                "relocated",
+                "--output",
+                "ndjson",
+                "--fields",
+                "file_name",
+                "--scan-root",
+                str(self.tmp_dir),
+                "--reconcile-max-records",
+                "1",
+            ],
+            capture_output=True,
+            text=True,
+            cwd=self.repo,
+            env=self.env,
+            check=False,
+        )
+        self.assertEqual(proc.returncode, 0)
+        lines = [json.loads(line) for line in proc.stdout.splitlines()]
+        self.assertEqual(
+            [line["type"] for line in lines],
+            ["header", "record", "record", "update", "update", "trailer"],
+        )
+        # Records keep id for matching; both captures of the hash are updated
+        # although only one scan was allowed.
+        self.assertEqual(set(lines[1]["data"]), {"id", "file_name"})
+        self.assertEqual(lines[1]["data"]["file_name"], "sample.txt")
+        self.assertEqual(
+            {line["data"]["id"] for line in lines[3:5]},
+            {line["data"]["id"] for line in lines[1:3]},
+        )
+        self.assertEqual(lines[3]["data"], {"id": lines[3]["data"]["id"], "file_name": "moved.txt"})
+        self.assertEqual(lines[5]["data"]["reconciled"], 2)
+
+    def test_reads_do_not_wait_on_another_writer(self) -> None:
+        rc, payload = self.run_core("search", "--q", "")
+        self.assertEqual(rc, 0)
+        self.assertTrue(payload["ok"])
+
+        conn = sqlite3.connect(self.tmp_db.name, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            started = time.monotonic()
+            rc, payload = self.run_core("search", "--q", "anything")
+            elapsed = time.monotonic() - started
+            conn.execute("ROLLBACK")
+        finally:
+            conn.close()
+        self.assertEqual(rc, 0)
+        self.assertTrue(payload["ok"])
+        self.assertLess(elapsed, 2.0)
+
+    def test_write_gives_up_with_db_busy_while_another_writer_holds_the_lock(self) -> None:
+        with CtxCore(Path(self.tmp_db.name)) as core:
+            # Keep the test fast: each BEGIN IMMEDIATE attempt waits 10ms, not 2s.
+            core.db.conn.execute("PRAGMA busy_timeout=10")
+            conn = sqlite3.connect(self.tmp_db.name, isolation_level=None)
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                rc, payload = core.execute(["reconcile-stats", "--reset"])
+                conn.execute("ROLLBACK")
+            finally:
+                conn.close()
+        self.assertEqual(rc, 1)
+        self.assertEqual(payload["error"]["code"], "DB_BUSY")
+        self.assertEqual(payload["error"]["details"]["attempts"], 5)
+
+    def test_in_process_api_matches_cli_envelopes(self) -> None:
+        with CtxCore(Path(self.tmp_db.name)) as core:
+            rc, payload = core.lookup(str(self.sample), verify=True)
+            self.assertEqual(rc, 0)
+            self.assertEqual(payload, self.run_core("lookup", "--path", str(self.sample), "--verify")[1])
+
+            rc, payload = core.lookup(str(self.tmp_dir / "missing.txt"))
+            self.assertEqual(rc, 1)
+            self.assertEqual(payload["error"]["code"], "FILE_NOT_FOUND")
+
+            # Values that look like options are passed through, not parsed.
+            rc, payload = core.lookup("-weird.txt")
+            self.assertEqual(payload["error"]["code"], "FILE_NOT_FOUND")
+            rc, payload = core.search("-draft", reconcile_paths=False)
+            self.assertEqual(rc, 0)
+            self.assertEqual(payload["data"]["count"], 0)
+
+            # The caller's namespace is left as it was.
+            args = command_args("search", q="anything", reconcile_paths=False)
+            list(core.stream_args(args))
+            self.assertEqual(args.output, "json")
+
+            messages = list(core.stream_search("anything", reconcile_paths=False))
+            self.assertEqual([m["type"] for m in messages], ["header", "trailer"])
+            self.assertTrue(messages[-1]["ok"])
+
+    def test_doctor_reports_health_and_query_plans(self) -> None:
+        rc, payload = self.run_core("doctor", "--repair", "wal-checkpoint")
+        self.assertEqual(rc, 0)
+        self.assertTrue(payload["ok"])
+        data = payload["data"]
+        self.assertEqual(data["database"]["captures_rows"], 0)
+        self.assertEqual(data["database"]["journal_mode"], "wal")
+        plans = {plan["query"]: plan for plan in data["queries"]}
+        self.assertEqual([name for name, plan in plans.items() if plan["full_scans"]], [])
+        self.assertEqual(data["warnings"], [])
+        self.assertTrue(plans["search_like"]["notes"])
+        self.assertEqual(data["repairs"][0]["action"], "wal-checkpoint")
+
+        # Without the file_hash index, lookups walk captures in created_at order.
+        conn = sqlite3.connect(self.tmp_db.name)
+        conn.execute("DROP INDEX idx_captures_file_hash_created_at")
+        conn.close()
+        rc, payload = self.run_core("doctor")
+        plans = {plan["query"]: plan for plan in payload["data"]["queries"]}
+        self.assertEqual(
+            plans["lookup_by_hash"]["full_scans"],
+            ["SCAN captures USING INDEX idx_captures_created_at"],
+        )
+        self.assertTrue(
+            any("lookup_by_hash" in warning for warning in payload["data"]["warnings"])
+        )
+
+        # Without the created_at index, recent search has to sort every row.
+        conn = sqlite3.connect(self.tmp_db.name)
+        conn.execute("DROP INDEX idx_captures_created_at")
+        conn.close()
+        rc, payload = self.run_core("doctor")
+        plans = {plan["query"]: plan for plan in payload["data"]["queries"]}
+        self.assertIn("SCAN captures", plans["search_recent"]["full_scans"])
+        self.assertIn("USE TEMP B-TREE FOR ORDER BY", plans["search_recent"]["full_scans"])
+        self.assertTrue(plans["search_like"]["full_scans"])
+
+    def test_stats_reports_latency_percentiles_per_backend(self) -> None:
+        for _ in range(3):
+            rc, _ = self.run_core("search", "--q", "")
+            self.assertEqual(rc, 0)
+        rc, _ = self.run_core("lookup", "--path", str(self.tmp_dir / "missing.txt"))
+        self.assertEqual(rc, 1)
+
+        rc, payload = self.run_core("stats", "--window", "1h")
+        self.assertEqual(rc, 0)
+        self.assertTrue(payload["ok"])
+        groups = {
+            (group["command"], group["backend"]): group
+            for group in payload["data"]["windows"][0]["groups"]
+        }
+        recent = groups[("search", "recent")]
+        self.assertEqual(recent["count"], 3)
+        self.assertLessEqual(recent["p50_ms"], recent["p99_ms"])
+        self.assertEqual(groups[("lookup", None)]["outcomes"], {"FILE_NOT_FOUND": 1})
+        self.assertEqual(payload["data"]["pending_samples"], 0)
+
+        # Read-only commands only spool their sample, so they never wait on a
+        # writer; a stats run that can't get the lock leaves the spool as is.
+        conn = sqlite3.connect(self.tmp_db.name, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            rc, _ = self.run_core("lookup", "--path", str(self.tmp_dir / "missing.txt"))
+            rc, payload = self.run_core("stats", "--window", "1h")
+            conn.execute("ROLLBACK")
+        finally:
+            conn.close()
+        # The previous stats sample and the lookup.
+        self.assertEqual(payload["data"]["pending_samples"], 2)
+        rc, payload = self.run_core("stats", "--window", "1h", "--command", "lookup")
+        self.assertEqual(payload["data"]["pending_samples"], 0)
+        self.assertEqual(payload["data"]["windows"][0]["groups"][0]["count"], 2)
+
+    def test_lookup_uncaptured_file_skips_full_hash(self) -> None:
+        other = self.tmp_dir / "other.txt"
+        other.write_text("never captured", encoding="utf-8")
+
+        rc, payload = self.run_core("lookup", "--path", str(other))
+        self.assertEqual(rc, 0)
+        self.assertTrue(payload["ok"])
+        self.assertEqual(payload["data"]["count"], 0)
+        self.assertIsNone(payload["data"]["file_hash"])
+        self.assertFalse(payload["data"]["verified"])
+
+        rc, payload = self.run_core("lookup", "--path", str(other), "--verify")
+        self.assertEqual(rc, 0)
+        self.assertTrue(payload["ok"])
+        self.assertEqual(payload["data"]["count"], 0)
+        self.assertEqual(len(payload["data"]["file_hash"]), 64)
+        self.assertTrue(payload["data"]["verified"])
+
+    def test_retain_moves_rows_to_searchable_archive(self) -> None:
+        time.sleep(2.2)
+        rc, _ = self.run_core(
+            "capture",
+            "--downloads-dir",
+            str(self.tmp_dir),
+            "--origin-title",
+            "Archived example",
+            "--origin-url",
+            "https://example.com/archived",
+        )
+        self.assertEqual(rc, 0)
+
+        # Rows that are checked and kept count toward --max-rows and --max-seconds.
+        rc, payload = self.run_core("retain", "--missing-files", "--max-rows", "1", "--dry-run")
+        self.assertEqual((payload["data"]["scanned"], payload["data"]["selected"]), (1, 0))
+        rc, payload = self.run_core("retain", "--missing-files", "--max-seconds", "0", "--dry-run")
+        self.assertTrue(payload["data"]["timed_out"])
+        self.assertEqual(payload["data"]["scanned"], 0)
+
+        rc, payload = self.run_core("retain", "--keep-latest", "0", "--dry-run")
+        self.assertEqual(rc, 0)
+        self.assertEqual(payload["data"]["selected"], 1)
+        self.assertEqual(payload["data"]["deleted"], 0)
+
+        rc, payload = self.run_core("retain", "--keep-latest", "0")
+        self.assertEqual(rc, 0)
+        self.assertTrue(payload["ok"])
+        self.assertEqual(payload["data"]["archived"], 1)
+        self.assertEqual(payload["data"]["deleted"], 1)
+
+        rc, payload = self.run_core("search", "--q", "archived", "--no-reconcile-paths")
+        self.assertEqual(rc, 0)
+        self.assertEqual(payload["data"]["count"], 0)
+
+        rc, payload = self.run_core(
+            "search", "--q", "archived", "--no-reconcile-paths", "--include-archive"
+        )
+        self.assertEqual(rc, 0)
+        self.assertEqual(payload["data"]["count"], 1)
+        self.assertTrue(payload["data"]["results"][0]["archived"])
+        self.assertEqual(payload["data"]["archive_backend"], "fts5")
+
+        # Search never migrates the archive; an outdated one is unavailable.
+        archive_path = self.tmp_db.name.replace(".sqlite", "-archive.sqlite")
+        conn = sqlite3.connect(archive_path)
+        with conn:
+            conn.execute("DELETE FROM schema_migrations WHERE version = 9")
+        conn.close()
+        rc, payload = self.run_core(
+            "search", "--q", "archived", "--no-reconcile-paths", "--include-archive"
+        )
+        self.assertEqual(payload["data"]["count"], 0)
+        self.assertEqual(payload["data"]["archive_backend"], "unavailable")
+        conn = sqlite3.connect(archive_path)
+        versions = {row[0] for row in conn.execute("SELECT version FROM schema_migrations")}
+        conn.close()
+        self.assertNotIn(9, versions)
+
+        rc, payload = self.run_core("compact", "--max-seconds", "1")
+        self.assertEqual(rc, 0)
+        self.assertTrue(payload["ok"])
+        self.assertTrue(payload["data"]["incremental_vacuum"])
+
+        rc, payload = self.run_core("doctor")
+        self.assertEqual(rc, 0)
+        self.assertEqual(payload["data"]["fts"]["rows"], 0)
+        self.assertEqual(payload["data"]["fts"]["misaligned_rows"], 0)
+
+    def test_columnar_output_sends_field_names_once(self) -> None:
+        time.sleep(2.2)
+        rc, _ = self.run_core(
+            "capture",
+            "--downloads-dir",
+            str(self.tmp_dir),
+            "--origin-title",
+            "Columnar example",
+            "--origin-url",
+            "https://example.com/columnar",
+        )
+        self.assertEqual(rc, 0)
+
+        rc, payload = self.run_core(
+            "search", "--q", "columnar", "--output", "columnar", "--fields", "id,file_name"
+        )
+        self.assertEqual(rc, 0)
+        self.assertTrue(payload["ok"])
+        self.assertEqual(payload["data"]["fields"], ["id", "file_name"])
+        self.assertEqual(payload["data"]["count"], 1)
+        self.assertEqual(payload["data"]["rows"][0][1], "sample.txt")
+
+        # The JSON envelope can't be projected, so --fields there is an error.
+        rc, payload = self.run_core("search", "--q", "columnar", "--fields", "id,file_name")
+        self.assertEqual(rc, 1)
+        self.assertEqual(payload["error"]["code"], "INVALID_ARGUMENTS")
+
+        proc = subprocess.run(
+            ["python3", "-m", "ctx_core", "search", "--q", "columnar", "--output", "columnar-framed"],
+            capture_output=True,
+            cwd=self.repo,
+            env=self.env,
+            check=False,
+        )
+        self.assertEqual(proc.returncode, 0)
+        header, row, trailer = list(iter_frames(proc.stdout))
+        self.assertEqual(header["type"], "header")
+        self.assertEqual(row[header["fields"].index("origin_title")], "Columnar example")
+        self.assertEqual(trailer["data"]["count"], 1)
+
+    def test_migrate_resumes_backfill_across_invocations(self) -> None:
+        rc, payload = self.run_core("migrate")
+        self.assertEqual(rc, 0)
+        self.assertEqual(payload["data"]["pending_backfills"], 0)
+        self.assertTrue(all(entry["state"] == "done" for entry in payload["data"]["migrations"]))
+
+        # Simulate captures written before the origin_host backfill finished.
+        conn = sqlite3.connect(self.tmp_db.name)
+        try:
+            with conn:
+                conn.executemany(
+                    """
+                    INSERT INTO captures (
+                      id, created_at, file_hash, file_name, file_size_bytes,
+                      file_path_at_capture, origin_title, origin_url
+                    ) VALUES (?, 1, 'hash', 'f.txt', 1, '/f.txt', 'Old', 'https://www.Example.com/')
+                    """,
+                    [(f"old-{index}",) for index in range(3)],
+                )
+                conn.execute(
+                    "UPDATE schema_migrations SET state = 'backfilling' WHERE version = 7"
+                )
+        finally:
+            conn.close()
+
+        def origin_host_status(migrations: list[dict]) -> tuple[str, int, int]:
+            entry = next(entry for entry in migrations if entry["name"] == "origin_host")
+            return entry["state"], entry["rows_done"], entry["rows_remaining"]
+
+        # --status only reports.
+        for _ in range(2):
+            rc, payload = self.run_core("migrate", "--status")
+            self.assertEqual(rc, 0)
+            self.assertEqual(origin_host_status(payload["data"]["migrations"]), ("backfilling", 0, 3))
+
+        # Each invocation runs one two-row chunk and resumes from the stored cursor.
+        progress = []
+        for _ in range(3):
+            db = Database(Path(self.tmp_db.name))
+            try:
+                self.assertEqual(db.run_backfills(max_seconds=0, chunk_rows=2), 1)
+                progress.append(origin_host_status(db.migration_status()))
+            finally:
+                db.close()
+        self.assertEqual(
+            progress, [("backfilling", 2, 1), ("backfilling", 3, 0), ("done", 3, 0)]
+        )
+
+        rc, payload = self.run_core(
+            "search", "--q", "", "--output", "columnar", "--fields", "origin_host"
+        )
+        self.assertEqual(rc, 0)
+        self.assertEqual(payload["data"]["rows"], [["example.com"]] * 3)
+
+    def test_async_engine_streams_reconcile_updates_after_results(self) -> None:
+        time.sleep(2.2)
+        rc, payload = self.run_core(
+            "capture",
+            "--engine",
+            "async",
+            "--downloads-dir",
+            str(self.tmp_dir),
+            "--origin-title",
+            "Async example",
+            "--origin-url",
+            "https://example.com/async",
+        )
+        self.assertEqual(rc, 0)
+        self.assertTrue(payload["ok"])
+        self.assertEqual(payload["data"]["capture"]["file_size_bytes"], 5)
+
+        moved_dir = self.tmp_dir / "nested"
+        moved_dir.mkdir()
+        moved = moved_dir / "moved.txt"
+        self.sample.rename(moved)
+
+        proc = subprocess.run(
+            [
+                "python3",
+                "-m",
+                "ctx_core",
+                "search",
+                "--q",
+                "async",
+                "--engine",
+                "async",
+                "--output",
+                "ndjson",
+                "--fields",
+                "file_name",
+                "--scan-root",
+                str(self.tmp_dir),
+            ],
+            capture_output=True,
+            text=True,
+            cwd=self.repo,
+            env=self.env,
+            check=False,
+        )
+        self.assertEqual(proc.returncode, 0)
+        lines = [json.loads(line) for line in proc.stdout.splitlines()]
+        self.assertEqual([line["type"] for line in lines], ["header", "record", "update", "trailer"])
+        # The projection keeps id so the update can be matched to its record,
+        # and applies to updates as well as records.
+        self.assertEqual(set(lines[1]["data"]), {"id", "file_name"})
+        self.assertEqual(lines[2]["data"], {"id": lines[1]["data"]["id"], "file_name": "moved.txt"})
+        self.assertEqual(lines[3]["data"]["reconciled"], 1)
+
+        rc, payload = self.run_core("search", "--q", "async", "--no-reconcile-paths")
+        self.assertEqual(rc, 0)
+        self.assertEqual(payload["data"]["results"][0]["file_name"], "moved.txt")
+
 
 if __name__ == "__main__":
     unittest.main()